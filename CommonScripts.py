@@ -6,6 +6,7 @@
 # </summary>
 
 import system
+from collections import defaultdict
 from MagnaDataOps import ProjectLists
 from MagnaDataOps import LoggerFunctions as Log
 
@@ -98,30 +99,30 @@ def get_next_popup_slot(stackDict, max_slots=5):
     except Exception:
         raw = {}
 
-    used = set()
+    # Bit i set => slot i in use; larger indices collapse onto one overflow bit
+    slots = int(max_slots)
+    cap = max(slots, 2)
+    mask = 0
     for k in raw:
         ks = str(k).strip()
         if ks.endswith("L"):  # clean Jython long repr like '3L'
             ks = ks[:-1]
         try:
-            used.add(int(ks))
+            mask |= 1 << min(int(ks), cap)
         except Exception:
             continue
 
-    if 0 not in used and 1 not in used:
+    if not mask & 3:
         return 0
 
-    if used:
-        max_used = max(used)
-        for i in range(max_used + 1, int(max_slots)):
-            if i not in used:
-                return i
+    free = ~mask & ((1 << slots) - 1)
+    if not free:
+        return None
 
-    for i in range(int(max_slots)):
-        if i not in used:
-            return i
-
-    return None
+    # Lowest free slot above max(used), else lowest free slot overall
+    above = free & ~((1 << mask.bit_length()) - 1)
+    pick = above or free
+    return (pick & -pick).bit_length() - 1
 
 
 # Project Library Script: StringUtils.py
@@ -142,6 +143,17 @@ def to_sentence_case(text):
         return text
 
 
+# screen_key -> default component name ("screen_key" -> "cntScreenKey"); keys are stable
+_COMP_NAME_CACHE = {}
+
+def _comp_name(screen_key):
+    name = _COMP_NAME_CACHE.get(screen_key)
+    if name is None:
+        name = "cnt" + "".join([part.capitalize() for part in screen_key.split("_")])
+        _COMP_NAME_CACHE[screen_key] = name
+    return name
+
+
 def apply_screen_exclusions(self, code_list, component_map=None, view_name="UnknownSubview"):
     """
     Disable/hide components per exclusion IDs resolved from session roles.
@@ -157,27 +169,25 @@ def apply_screen_exclusions(self, code_list, component_map=None, view_name="Unkn
 
         user_roles = list(self.session.props.auth.user.roles)
         role_access_ds = self.session.custom.userAccess
-        role_to_excl = {role: set() for role in user_roles}
+        # Keyed by normalized role name; every session role starts with no exclusions
+        role_to_excl = dict((str(r).strip().lower(), set()) for r in user_roles)
 
         if hasattr(role_access_ds, "rowCount") and role_access_ds.rowCount:
             for row in role_access_ds:
                 sid = row["screen_exclusion_id"]
-                role_name = row["user_role_name"]
-                for r in user_roles:
-                    if str(r).strip().lower() == str(role_name).strip().lower() and sid is not None:
-                        role_to_excl[r].add(sid)
+                if sid is None:
+                    continue
+                excl_set = role_to_excl.get(str(row["user_role_name"]).strip().lower())
+                if excl_set is not None:
+                    excl_set.add(sid)
 
-            intersection = None
-            for excl_set in role_to_excl.values():
-                intersection = excl_set if intersection is None else intersection.intersection(excl_set)
-            if intersection is None:
-                intersection = set()
+            intersection = set.intersection(*role_to_excl.values()) if role_to_excl else set()
 
             for screen_key, exclusion_id in code_list.items():
                 if component_map and screen_key in component_map:
                     comp_name = component_map[screen_key]
                 else:
-                    comp_name = "cnt" + "".join([part.capitalize() for part in screen_key.split("_")])
+                    comp_name = _comp_name(screen_key)
 
                 try:
                     comp = self.getChild("root").getChild(comp_name)
@@ -211,20 +221,24 @@ def apply_individual_screen_access_return_flag(viewRef, screen_id, view_name):
             Log.log_error("{}/apply_individual_screen_access_return_flag::NoAccess".format(MODULE))
             return False
 
+        # Group access rows by normalized role name (single pass over column lists)
+        roles_norm = set(str(r).strip().lower() for r in user_roles)
+        role_col  = role_access_ds.getColumnAsList(role_access_ds.getColumnIndex("user_role_name"))
+        excl_col  = role_access_ds.getColumnAsList(role_access_ds.getColumnIndex("screen_exclusion_id"))
+        write_col = role_access_ds.getColumnAsList(role_access_ds.getColumnIndex("write_access"))
+        by_role = defaultdict(list)
+        for i in xrange(len(role_col)):
+            by_role[str(role_col[i]).strip().lower()].append((excl_col[i], write_col[i]))
+
         write_allowed = False
         all_roles_excluded = True
 
-        for row in system.dataset.toPyDataSet(role_access_ds):
-            role_name = row["user_role_name"]
-            exclusion_id = row["screen_exclusion_id"]
-            write_access = row["write_access"]
-
-            for r in user_roles:
-                if str(r).strip().lower() == str(role_name).strip().lower():
-                    if exclusion_id is None or exclusion_id != screen_id:
-                        all_roles_excluded = False
-                        if write_access == 1:
-                            write_allowed = True
+        for role in roles_norm:
+            for exclusion_id, write_access in by_role.get(role, ()):
+                if exclusion_id is None or exclusion_id != screen_id:
+                    all_roles_excluded = False
+                    if write_access == 1:
+                        write_allowed = True
 
         if all_roles_excluded:
             return False
@@ -246,11 +260,9 @@ def generate_csv_template(self, headers, filename="Upload_Template.csv"):
         filename (str): Suggested download filename (default: 'Upload_Template.csv').
     """
     try:
-        data = [["" for _ in headers]]
-        template_dataset = system.dataset.toDataSet(headers, data)
-
-        # system.dataset.toCSV returns CSV text; set correct MIME
-        csv_text = system.dataset.toCSV(showHeaders=True, dataset=template_dataset)
+        # Header + one blank row; written directly (no DataSet/toCSV round-trip)
+        header_line = ",".join('"%s"' % unicode(h).replace('"', '""') for h in headers)
+        csv_text = header_line + "\r\n" + ",".join([""] * len(headers)) + "\r\n"
 
         system.perspective.download(
             fileName=filename,
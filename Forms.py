@@ -6,36 +6,43 @@
 # </summary>
 
 import system
-from cgi import escape
 from collections import OrderedDict
 from json import dumps, loads
 from re import compile as re_compile
 from system.util import jsonEncode
 from java.text import SimpleDateFormat
 from java.util import TimeZone, Date
+from java.lang import StringBuilder, ThreadLocal
 from system.date import now
 
 from MagnaDataOps import LoggerFunctions as Log
 
 MODULE = "Forms"
 
+def _thread_local_format(pattern, tz):
+    """Per-thread SimpleDateFormat (SimpleDateFormat is not thread-safe)."""
+    class _Format(ThreadLocal):
+        def initialValue(self):
+            fmt = SimpleDateFormat(pattern)
+            fmt.setTimeZone(tz)
+            return fmt
+    return _Format()
+
 # ISO formatter (UTC)
-ISO_FMT = SimpleDateFormat("yyyy-MM-dd'T'HH:mm:ss.SSS")
-ISO_FMT.setTimeZone(TimeZone.getTimeZone("UTC"))
+ISO_FMT = _thread_local_format("yyyy-MM-dd'T'HH:mm:ss.SSS", TimeZone.getTimeZone("UTC"))
 
 # Parse formats (UTC)
 PARSE_FMTS = [
-    SimpleDateFormat("MMM d, yyyy, h:mm:ss a"),      # Aug 14, 2025, 9:01:18 AM
-    SimpleDateFormat("yyyy-MM-dd'T'HH:mm:ss"),       # 2025-08-14T09:01:18
-    SimpleDateFormat("yyyy-MM-dd'T'HH:mm:ss'Z'"),    # 2025-08-14T09:01:18Z
-    SimpleDateFormat("yyyy-MM-dd HH:mm:ss"),         # 2025-08-14 09:01:18
+    _thread_local_format(p, TimeZone.getTimeZone("UTC")) for p in (
+        "MMM d, yyyy, h:mm:ss a",       # Aug 14, 2025, 9:01:18 AM
+        "yyyy-MM-dd'T'HH:mm:ss",        # 2025-08-14T09:01:18
+        "yyyy-MM-dd'T'HH:mm:ss'Z'",     # 2025-08-14T09:01:18Z
+        "yyyy-MM-dd HH:mm:ss",          # 2025-08-14 09:01:18
+    )
 ]
-for fmt in PARSE_FMTS:
-    fmt.setTimeZone(TimeZone.getTimeZone("UTC"))
 
 # Local-offset timestamp for header
-OFFSET_TS_FMT = SimpleDateFormat("yyyy-MM-dd'T'HH:mm:ss.SSSXXX")
-OFFSET_TS_FMT.setTimeZone(TimeZone.getDefault())
+OFFSET_TS_FMT = _thread_local_format("yyyy-MM-dd'T'HH:mm:ss.SSSXXX", TimeZone.getDefault())
 
 # Recognize already-ISO strings so we don't re-parse (handles .SSS and zones)
 ISO_LIKE_RE = re_compile(
@@ -45,52 +52,161 @@ ISO_LIKE_RE = re_compile(
     r'(?:Z|[+\-]\d{2}:\d{2})?$'    # optional zone
 )
 
+# Syntax highlighting for pretty-printed JSON lines (keys / scalar values)
+KEY_RE = re_compile(r'^(\s*)"([^"]+)":')
+VAL_RE = re_compile(r':\s*("(?:[^"\\]|\\.)*"|\d+(?:\.\d+)?|true|false|null)(,?)$')
+
+# Preview styling + precomputed %-templates (built once, not per line)
+KEY_COLOR = "#2F54EB"
+VAL_COLOR = "#D97706"
+DEF_COLOR = "#16A34A"
+WEIGHT    = "500"
+INDENT    = 8
+SPECIAL_KEYS = ("version", "timestamp")
+TS_KEYS = ("Timestamp", "timestamp", "TIMESTAMP")
+_MISSING = object()
+BRACE_LINES = frozenset(("{", "}", "[", "]", "},", "],"))
+BADGE_CSS = (
+    "display:inline-block;width:16px;height:16px;border-radius:50%;"
+    "background:#E0E7FF;color:#2F54EB;font-size:10px;line-height:16px;"
+    "text-align:center;margin-right:4px;font-weight:" + WEIGHT
+)
+GUTTER_CSS = (
+    "display:inline-block;width:2em;font-size:0.7em;"
+    "color:#AAA;text-align:right;padding-right:6px;"
+    "border-right:1px solid #DDD;margin-right:8px;"
+)
+LINE_CSS = (
+    "line-height:1.8;letter-spacing:0.4px;white-space:pre;"
+    "border-bottom:1px solid #EEE;padding:2px 0;"
+)
+KEY_TPL = "%s<span style='" + BADGE_CSS.replace("%", "%%") + "'>%d</span>" \
+          '<span style="color:%s;font-weight:' + WEIGHT + ';">"%s"</span>:%s'
+VAL_TPL = ': <span style="color:' + VAL_COLOR + ';font-weight:' + WEIGHT + ';">%s</span>%s'
+ROW_OPEN  = "<div style='" + LINE_CSS + "'><span style='" + GUTTER_CSS + "'>"
+ROW_MID   = "</span>"
+ROW_CLOSE = "</div>"
+
+
+def _esc(s):
+    """HTML-escape &, <, > and double quotes (same output as cgi.escape(s, True))."""
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+def _val_repl(m):
+    """VAL_RE substitution: wrap a scalar JSON value in a colored span."""
+    return VAL_TPL % (_esc(m.group(1)), m.group(2))
+
 # ---------- helpers ----------
+_JSON_SCALARS = (basestring, bool, int, long, float)
+
+class _NotPlainJson(Exception):
+    pass
+
+def _json_text(s):
+    """unicode for a str/unicode key or value, as loads() would return; _NotPlainJson if it won't decode."""
+    if isinstance(s, unicode):
+        return s
+    try:
+        return unicode(s)
+    except UnicodeError:
+        raise _NotPlainJson()
+
+def _ordered_copy(node):
+    """
+    Deep-copy plain dict/list payloads as OrderedDict/list with unicode strings (same shape as
+    the jsonEncode/loads round-trip); raise _NotPlainJson on non-string keys or other values.
+    """
+    if isinstance(node, dict):
+        out = OrderedDict()
+        for k, v in node.items():
+            if not isinstance(k, basestring):
+                raise _NotPlainJson()   # jsonEncode decides how int/bool keys are stringified
+            out[_json_text(k)] = _ordered_copy(v)
+        return out
+    if isinstance(node, list):
+        return [_ordered_copy(v) for v in node]
+    if isinstance(node, basestring):
+        return _json_text(node)
+    if node is None or isinstance(node, _JSON_SCALARS):
+        return node
+    raise _NotPlainJson()
+
+def _normalize_payload(payload):
+    """Copy payload into OrderedDict/list form, skipping the jsonEncode/loads round-trip when possible."""
+    if isinstance(payload, (dict, list)):
+        try:
+            return _ordered_copy(payload)
+        except _NotPlainJson:
+            pass  # Java/Ignition values need jsonEncode's coercion
+    return loads(jsonEncode(payload), object_pairs_hook=OrderedDict)
+
 def to_iso(dt=None):
     """Format a java.util.Date as ISO-8601 UTC string."""
-    return ISO_FMT.format(dt if dt else now())
+    return ISO_FMT.get().format(dt if dt else now())
 
 def try_parse_date(val):
     """Try multiple formats; raise ValueError if none match (no 'except/continue')."""
     last_err = None
     for fmt in PARSE_FMTS:
         try:
-            return fmt.parse(val)
+            return fmt.get().parse(val)
         except Exception as e:
             last_err = e
             # loop proceeds naturally
     Log.log_error("{}/try_parse_date | Unparseable date: {}".format(MODULE, unicode(val)))
     raise ValueError("Unparseable date: " + unicode(val))
 
-# Recursively process structure and convert date strings
-MAX_DEPTH = 1000
-def convert_dates(node, depth=0):
-    if depth > MAX_DEPTH:
-        raise RuntimeError("Max recursion depth exceeded")
+# Per-key memo caches (payload schemas repeat, so hit rate is high after warm-up)
+_KEY_CACHE_MAX = 4096
+_LOWER_CACHE = {}
+_DATE_KEY_CACHE = {}
+_DATEKEY_RE = re_compile(r'date|time')
+
+def _lower(k):
+    kl = _LOWER_CACHE.get(k)
+    if kl is None:
+        kl = k.lower()
+        if len(_LOWER_CACHE) < _KEY_CACHE_MAX:
+            _LOWER_CACHE[k] = kl
+    return kl
+
+# Date/time-looking key test (excluding explicit "timestamp")
+def _is_date_key(k):
+    hit = _DATE_KEY_CACHE.get(k)
+    if hit is None:
+        kl = _lower(k)
+        hit = kl != "timestamp" and _DATEKEY_RE.search(kl) is not None
+        if len(_DATE_KEY_CACHE) < _KEY_CACHE_MAX:
+            _DATE_KEY_CACHE[k] = hit
+    return hit
 
+# Walk structure (explicit work-list, no recursion) and convert date strings
+def convert_dates(node):
     try:
         text_types = (basestring,)
     except NameError:
         text_types = (str,)
 
-    if isinstance(node, dict):
-        for k, v in node.items():
-            kl = k.lower()
-            if isinstance(v, text_types) and kl != "timestamp" and ("date" in kl or "time" in kl):
-                try:
-                    # Leave ISO-like values as-is (prevents ms parse failures)
-                    if ISO_LIKE_RE.match(v):
-                        node[k] = v
-                    else:
-                        node[k] = to_iso(try_parse_date(v))
-                except Exception as e:
-                    Log.log_error("{}/convert_dates | {}".format(MODULE, unicode(e)))
-                    node[k] = to_iso()
-            elif isinstance(v, (dict, list)):
-                convert_dates(v, depth + 1)
-    elif isinstance(node, list):
-        for item in node:
-            convert_dates(item, depth + 1)
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for k, v in node.items():
+                if isinstance(v, text_types) and _is_date_key(k):
+                    try:
+                        # Leave ISO-like values as-is (prevents ms parse failures)
+                        if ISO_LIKE_RE.match(v):
+                            node[k] = v
+                        else:
+                            node[k] = to_iso(try_parse_date(v))
+                    except Exception as e:
+                        Log.log_error("{}/convert_dates | {}".format(MODULE, unicode(e)))
+                        node[k] = to_iso()
+                elif isinstance(v, (dict, list)):
+                    stack.append(v)
+        elif isinstance(node, list):
+            stack.extend(node)
 
 # ========== Main Entry Point ==========
 def renderJsonPreview(payload, desired_order, isStatusPayload=False, isOvercyclePayload=False):
@@ -100,19 +216,8 @@ def renderJsonPreview(payload, desired_order, isStatusPayload=False, isOvercycle
     isStatusPayload: if True, render payload as-is (no Version/Timestamp injection, no reordering, no date conversion)
     isOvercyclePayload: if True, same as isStatusPayload (as-is rendering), but with title 'Overcycle Payload'
     """
-    KEY_COLOR = "#2F54EB"
-    VAL_COLOR = "#D97706"
-    DEF_COLOR = "#16A34A"
-    WEIGHT    = "500"
-    INDENT    = 8
-    BADGE_CSS = (
-        "display:inline-block;width:16px;height:16px;border-radius:50%;"
-        "background:#E0E7FF;color:#2F54EB;font-size:10px;line-height:16px;"
-        "text-align:center;margin-right:4px;font-weight:{w}".format(w=WEIGHT)
-    )
-
     # Normalize to OrderedDict / list (preserves existing order of incoming JSON)
-    incoming = loads(jsonEncode(payload), object_pairs_hook=OrderedDict)
+    incoming = _normalize_payload(payload)
     as_is_mode = bool(isStatusPayload or isOvercyclePayload)
 
     if as_is_mode:
@@ -123,7 +228,10 @@ def renderJsonPreview(payload, desired_order, isStatusPayload=False, isOvercycle
         root = OrderedDict([("Version", "1.0.0")])
 
         # Move timestamp (if any) to the top (keep original value for now)
-        ts_key = next((k for k in incoming if k.lower() == "timestamp"), None)
+        # Probe canonical spellings first; scan all keys only on a miss
+        ts_key = next((c for c in TS_KEYS if c in incoming), None)
+        if ts_key is None:
+            ts_key = next((k for k in incoming if _lower(k) == "timestamp"), None)
         if ts_key:
             root["Timestamp"] = incoming.pop(ts_key)
 
@@ -135,13 +243,14 @@ def renderJsonPreview(payload, desired_order, isStatusPayload=False, isOvercycle
             else:
                 flat_order.append(item)
 
-        # Build output structure in desired order
+        # Build output structure in desired order, then append remaining keys
         for k in flat_order:
-            if k in incoming:
-                root[k] = incoming[k]
-        for k in incoming:
+            v = incoming.get(k, _MISSING)
+            if v is not _MISSING:
+                root[k] = v
+        for k, v in incoming.iteritems():
             if k not in root:
-                root[k] = incoming[k]
+                root[k] = v
 
         # Reorder nested lists by desired key order
         for outer_key, nest_order in nested_orders.items():
@@ -163,65 +272,11 @@ def renderJsonPreview(payload, desired_order, isStatusPayload=False, isOvercycle
         convert_dates(root)
 
         # Overwrite/insert Timestamp with local offset format (original behavior)
-        root["Timestamp"] = OFFSET_TS_FMT.format(Date())
+        root["Timestamp"] = OFFSET_TS_FMT.get().format(Date())
 
     # Pretty-print JSON (no content changes)
     pretty = dumps(root, indent=INDENT, separators=(",", ": "))
 
-    # --- syntax highlighting (keys/values) ---
-    key_re = re_compile(r'^(\s*)"([^"]+)":')
-    val_re = re_compile(r':\s*("(?:[^"\\]|\\.)*"|\d+(?:\.\d+)?|true|false|null)(,?)$')
-
-    badge_ct, html_lines = {}, []
-    for ln in pretty.splitlines():
-        stripped = ln.strip()
-        depth    = (len(ln) - len(stripped)) // INDENT
-
-        if stripped == "{":
-            badge_ct[depth] = 0
-        elif stripped == "}":
-            badge_ct.pop(depth, None)
-
-        km = key_re.match(ln)
-        if km:
-            key_txt = escape(km.group(2), True)
-            num     = badge_ct.setdefault(depth, 0) + 1
-            badge_ct[depth] = num
-            badge = "<span style='{css}'>{n}</span>".format(css=BADGE_CSS, n=num)
-            # Only special-color Version/Timestamp in mutated mode
-            special_keys = ("version", "timestamp")
-            colour = DEF_COLOR if (not as_is_mode and key_txt.lower() in special_keys) else KEY_COLOR
-            key_html = '{b}<span style="color:{c};font-weight:{w};">"{k}"</span>:'.format(
-                b=badge, c=colour, w=WEIGHT, k=key_txt
-            )
-            ln = " " * (depth * INDENT) + key_html + ln[km.end():]
-
-        def repl(m):
-            raw, tail = m.group(1), m.group(2)
-            safe = escape(raw, True)
-            return ': <span style="color:{col};font-weight:{w};">{txt}</span>{t}'.format(
-                col=VAL_COLOR, w=WEIGHT, txt=safe, t=tail
-            )
-
-        ln = val_re.sub(repl, ln)
-        html_lines.append(ln)
-
-    # Gutter with line numbers
-    gutter_css = (
-        "display:inline-block;width:2em;font-size:0.7em;"
-        "color:#AAA;text-align:right;padding-right:6px;"
-        "border-right:1px solid #DDD;margin-right:8px;"
-    )
-    line_css = (
-        "line-height:1.8;letter-spacing:0.4px;white-space:pre;"
-        "border-bottom:1px solid #EEE;padding:2px 0;"
-    )
-    rows = [
-        "<div style='{lc}'><span style='{gc}'>{r}</span>{code}</div>"
-        .format(lc=line_css, gc=gutter_css, r=i, code=code)
-        for i, code in enumerate(html_lines, 1)
-    ]
-
     # Titles
     if isStatusPayload:
         title_text = "Status Payload View"
@@ -230,12 +285,43 @@ def renderJsonPreview(payload, desired_order, isStatusPayload=False, isOvercycle
     else:
         title_text = "Payload Preview"
 
-    container = (
+    # Rows are streamed straight into one buffer (no per-line list + join)
+    sb = StringBuilder(len(pretty) * 4)
+    sb.append(
         "<div style='font-family:Aptos,monospace;font-size:1.05em;"
         "font-weight:300;color:#333;padding:6px;'>"
-        "<div style='font-size:1.1em;font-weight:bold;margin-bottom:6px;'>{title}</div>"
-        .format(title=title_text)
-        + "\n".join(rows) +
-        "</div>"
-    )
-    return container
\ No newline at end of file
+        "<div style='font-size:1.1em;font-weight:bold;margin-bottom:6px;'>"
+    ).append(title_text).append("</div>")
+
+    # --- syntax highlighting (keys/values) ---
+    # badge_ct[depth] = running key counter for that indent level
+    badge_ct, line_no = [], 0
+    for ln in pretty.splitlines():
+        stripped = ln.strip()
+        depth    = (len(ln) - len(stripped)) // INDENT
+        if depth >= len(badge_ct):
+            badge_ct.extend([0] * (depth + 1 - len(badge_ct)))
+
+        if stripped in BRACE_LINES:
+            # Pure structural line: nothing for the key/value regexes to match
+            if stripped == "{" or stripped == "}":
+                badge_ct[depth] = 0
+        else:
+            km = KEY_RE.match(ln)
+            if km:
+                key_txt = _esc(km.group(2))
+                badge_ct[depth] += 1
+                # Only special-color Version/Timestamp in mutated mode
+                colour = DEF_COLOR if (not as_is_mode and _lower(key_txt) in SPECIAL_KEYS) else KEY_COLOR
+                ln = KEY_TPL % (" " * (depth * INDENT), badge_ct[depth], colour, key_txt, ln[km.end():])
+
+            ln = VAL_RE.sub(_val_repl, ln)
+
+        # Gutter with line numbers
+        line_no += 1
+        if line_no > 1:
+            sb.append("\n")
+        sb.append(ROW_OPEN).append(line_no).append(ROW_MID).append(ln).append(ROW_CLOSE)
+
+    sb.append("</div>")
+    return sb.toString()
@@ -6,6 +6,27 @@
 
 from MagnaDataOps.SecureInputUtils import sanitize_for_logging
 from sys import exc_info
+from java.util.concurrent import LinkedBlockingQueue, TimeUnit
+from java.util.concurrent.atomic import AtomicBoolean
+
+# Async DB log writer: log_to_db enqueues, a single background worker drains
+_DB_LOG_QUEUE = LinkedBlockingQueue(10000)
+_DB_LOG_IDLE_SECONDS = 5
+_DB_LOG_WORKER_RUNNING = AtomicBoolean(False)
+
+# Raw logger name -> logger (avoids re-sanitizing the same name on every call)
+_LOGGERS = {}
+
+
+def _get_logger(logger_name):
+	"""
+	Return the (cached) logger for a raw logger name; sanitizes the name once.
+	"""
+	logger = _LOGGERS.get(logger_name)
+	if logger is None:
+		logger = system.util.getLogger(sanitize_for_logging(logger_name))
+		_LOGGERS[logger_name] = logger
+	return logger
 
 
 def log_error(location, user_id="NA", logger_name="MagnaDataOps", isDBWrite=False):
@@ -13,24 +34,28 @@ def log_error(location, user_id="NA", logger_name="MagnaDataOps", isDBWrite=Fals
 	Logs an error to system logs and optionally to DB.
 	"""
 
-	logger = system.util.getLogger(sanitize_for_logging(logger_name))
+	logger = _get_logger(logger_name)
+	enabled = logger.isErrorEnabled()
+	if not enabled and not isDBWrite:
+		return
+
 	exc_type, exc_obj, tb = exc_info()
 	lineno = tb.tb_lineno if tb else "Unknown"
+	safe_lineno = sanitize_for_logging(lineno)
+	safe_exc = sanitize_for_logging(exc_obj)
+
+	if enabled:
+		full_msg = "Error at {} |(Line {}) | Exception: {}".format(
+			sanitize_for_logging(location),
+			safe_lineno,
+			safe_exc
+		)
 
-	full_msg = "Error at {} |(Line {}) | Exception: {}".format(
-		sanitize_for_logging(location),
-		sanitize_for_logging(lineno),
-		sanitize_for_logging(exc_obj)
-	)
-
-	logger.error(full_msg)
-	custom_print(full_msg)
+		logger.error(full_msg)
+		custom_print(full_msg)
 
 	if isDBWrite:
-		short_msg = "Line {} | Exception: {}".format(
-			sanitize_for_logging(lineno),
-			sanitize_for_logging(exc_obj)
-		)
+		short_msg = "Line {} | Exception: {}".format(safe_lineno, safe_exc)
 		log_to_db("ERROR", location, short_msg, user_id)
 			
 
@@ -38,36 +63,42 @@ def log_warn(location, user_id="SYSTEM", message="Potential issue", logger_name=
 	"""
 	Logs a warning to system logs and optionally to DB.
 	"""
-	logger = system.util.getLogger(sanitize_for_logging(logger_name))
+	logger = _get_logger(logger_name)
+	enabled = logger.isWarnEnabled()
+	if not enabled and not isDBWrite:
+		return
 
-	full_msg = "Warning at {}: {}".format(
-		sanitize_for_logging(location),
-		sanitize_for_logging(message)
-	)
+	safe_msg = sanitize_for_logging(message)
 
-	logger.warn(full_msg)
-	custom_print(full_msg)
+	if enabled:
+		full_msg = "Warning at {}: {}".format(sanitize_for_logging(location), safe_msg)
+
+		logger.warn(full_msg)
+		custom_print(full_msg)
 
 	if isDBWrite:
-		log_to_db("WARN", location, sanitize_for_logging(message), user_id)
+		log_to_db("WARN", location, safe_msg, user_id)
 
 
 def log_info(location, user_id=0, message="Operation completed successfully", logger_name="MagnaDataOps", isDBWrite=False):
 	"""
 	Logs an info message to system logs and optionally to DB.
 	"""
-	logger = system.util.getLogger(sanitize_for_logging(logger_name))
+	logger = _get_logger(logger_name)
+	enabled = logger.isInfoEnabled()
+	if not enabled and not isDBWrite:
+		return
+
+	safe_msg = sanitize_for_logging(message)
 
-	full_msg = "Notification at {}: {}".format(
-		sanitize_for_logging(location),
-		sanitize_for_logging(message)
-	)
+	if enabled:
+		full_msg = "Notification at {}: {}".format(sanitize_for_logging(location), safe_msg)
 
-	logger.info(full_msg)
-	custom_print(full_msg)
+		logger.info(full_msg)
+		custom_print(full_msg)
 
 	if isDBWrite:
-		log_to_db("INFO", location, sanitize_for_logging(message), user_id)
+		log_to_db("INFO", location, safe_msg, user_id)
 
 
 def custom_print(message):
@@ -85,13 +116,15 @@ def get_full_path_with_context(component, viewPath="UnknownView", scriptContext=
 	Builds a full path like: ViewPath:component/path :: onActionPerformed
 	"""
 	try:
-		def build_path(comp):
-			path = comp.name
-			if hasattr(comp, 'parent') and comp.parent is not None:
-				path = build_path(comp.parent) + "/" + path
-			return path
-
-		component_path = build_path(component)
+		# Walk up the parent chain, then join root-first
+		parts = [component.name]
+		comp = getattr(component, 'parent', None)
+		while comp is not None:
+			parts.append(comp.name)
+			comp = getattr(comp, 'parent', None)
+		parts.reverse()
+
+		component_path = "/".join(parts)
 		full_path = "{}:{}".format(viewPath, component_path)
 		if scriptContext:
 			full_path += " :: {}".format(scriptContext)
@@ -123,7 +156,41 @@ def log_to_db(log_level, location, message,user_id):
 		except:
 			params["created_by"] = None
 
-		system.db.runNamedQuery("MagnaDataOps/Common/insertLogActivity", params)
+		# Non-blocking: hand off to the background writer; write inline only if the queue is full
+		if not _DB_LOG_QUEUE.offer(params):
+			_write_log_row(params)
+			return
+		if _DB_LOG_WORKER_RUNNING.compareAndSet(False, True):
+			system.util.invokeAsynchronous(_db_log_worker)
 
 	except Exception as e:
-		system.util.getLogger("MagnaDataOps").error("Failed to log to DB: " + str(e))
\ No newline at end of file
+		system.util.getLogger("MagnaDataOps").error("Failed to log to DB: " + str(e))
+
+
+def _write_log_row(params):
+	"""
+	Run the insert named query for one structured log row.
+	"""
+	try:
+		system.db.runNamedQuery("MagnaDataOps/Common/insertLogActivity", params)
+	except Exception as e:
+		system.util.getLogger("MagnaDataOps").error("Failed to log to DB: " + str(e))
+
+
+def _db_log_worker():
+	"""
+	Drain queued log rows off the caller thread; exit once the queue stays idle.
+	"""
+	while True:
+		try:
+			while True:
+				params = _DB_LOG_QUEUE.poll(_DB_LOG_IDLE_SECONDS, TimeUnit.SECONDS)
+				if params is None:
+					break
+				_write_log_row(params)
+		finally:
+			_DB_LOG_WORKER_RUNNING.set(False)
+
+		# A producer may have enqueued after the last poll but before the flag was cleared
+		if _DB_LOG_QUEUE.isEmpty() or not _DB_LOG_WORKER_RUNNING.compareAndSet(False, True):
+			return
\ No newline at end of file
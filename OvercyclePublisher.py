@@ -10,12 +10,22 @@
 # </summary>
 
 import system
+import heapq
+import bisect
 import traceback
 from MagnaDataOps.LoggerFunctions import (
     log_info as _log_info,
     log_warn as _log_warn,
     log_error as _log_error,
 )
+
+# Jackson (bundled with the gateway) serializes Jython dicts/lists directly through their
+# java.util.Map/List views; None => not on the script classpath, use system.util.jsonEncode
+try:
+    from com.fasterxml.jackson.databind import ObjectMapper as _ObjectMapper
+    _JSON = _ObjectMapper()
+except Exception:
+    _JSON = None
 # Toggle INFO logging (False = silent)
 ENABLE_INFO_LOGS = False
 
@@ -34,6 +44,11 @@ EPSILON    = 0.00
 _FINAL_GRACE_MIN = 18 * 60   # finalize shifts that ended within this many minutes
 _SHIFT_REFRESH_SEC = 60      # shift cache refresh
 
+# OCT source: False = classify raw CycleTime history in Python each tick.
+# True = read pre-classified per-station sums from the DB rollup (getOctDeltaByLineBetween);
+#        falls back to the Python path if that NQ fails.
+USE_DB_OCT_ROLLUP = False
+
 # ----------------------- small utils -----------------------
 def _u(x):
     try:
@@ -54,18 +69,22 @@ def _fmt_mmss(sec):
     sec = int(max(0, round(float(sec or 0))))
     return "%d:%02d" % (sec // 60, sec % 60)
 
+def _json(obj):
+    """JSON-encode a payload of dicts/lists/scalars (Jackson when available, else jsonEncode)."""
+    if _JSON is not None:
+        try:
+            return _JSON.writeValueAsString(obj)
+        except Exception:
+            pass
+    return system.util.jsonEncode(obj)
+
 def _rowdicts(ds):
     if not ds:
         return []
     try:
-        cols = list(ds.getColumnNames())
-        out = []
-        for i in range(ds.getRowCount()):
-            d = {}
-            for c in cols:
-                d[c] = ds.getValueAt(i, c)
-            out.append(d)
-        return out
+        py = system.dataset.toPyDataSet(ds)
+        cols = list(py.getColumnNames())
+        return [dict(zip(cols, list(r))) for r in py]
     except Exception:
         # dataset from NM query might already be py-rows
         return list(ds or [])
@@ -73,9 +92,10 @@ def _rowdicts(ds):
 def _san(s):
     return (s or u"").replace(" ", "")
 
-def _LI(where, msg):
+def _LI(where, fmt, *args):
+    # formatting is deferred until INFO logging is actually on
     if ENABLE_INFO_LOGS:
-        _log_info("{}/{}".format(MODULE, where), message=_u(msg))
+        _log_info("{}/{}".format(MODULE, where), message=_u(fmt % args if args else fmt))
 
 def _LW(where, msg):
     _log_warn("{}/{}".format(MODULE, where), message=_u(msg))
@@ -89,7 +109,17 @@ def _LE(where, msg=None, exc=None):
         _log_error("{}/{}".format(MODULE, where), message=_u(msg) if msg else u"Error")
 
 # ----------------------- hierarchy / topics -----------------------
+# Stations + hierarchy are effectively static across a shift; re-read at most every _SHIFT_REFRESH_SEC
+_static = {"stations": (0, None), "hier": (0, None, None)}
+
+def _fresh(ts):
+    return system.date.toMillis(system.date.now()) - ts < _SHIFT_REFRESH_SEC * 1000
+
 def _get_hierarchy(station_ids):
+    key = frozenset(int(s) for s in station_ids)
+    ts, cached_key, cached = _static["hier"]
+    if cached is not None and cached_key == key and _fresh(ts):
+        return cached
     try:
         ds = system.db.runNamedQuery(
             MBASE + "getHierarchyForStations",
@@ -107,49 +137,72 @@ def _get_hierarchy(station_ids):
                 "line_id":   int(r.get("line_id") or 0),
                 "station":   _u(r.get("station_name_clean") or r.get("station_name") or ("Station_%d" % sid)),
             }
+        _static["hier"] = (system.date.toMillis(system.date.now()), key, H)
         return H
     except Exception as e:
         _LE("_get_hierarchy", exc=e)
         return {}
 
+def _station_name(H, sid):
+    """Display name for a station (hierarchy name, else Station_<id>)."""
+    h = H.get(sid)
+    return (h and h.get("station")) or u"Station_%d" % sid
+
 def _san_name(h, key, default):
     return _san((h.get(key) if h else None) or default)
 
-def _topic_for_line(h, scope_slug):
-    return "m/%s/%s/%s/%s/line/%s/%s" % (
+def _topic_prefix(h):
+    """Line-level topic base "m/<div>/<plant>/<area>/<subarea>/line/<line>/" (append scope slug)."""
+    return "m/%s/%s/%s/%s/line/%s/" % (
         _san_name(h, "division", "NA"),
         _san_name(h, "plant",    "Plant"),
         _san_name(h, "area",     "Area"),
         _san_name(h, "subarea",  "SubArea"),
         _san_name(h, "line",     "Line"),
-        scope_slug
     )
 
-def _publish(topic, obj, qos=0, retain=False):
-    # Prefer the ProductionPublisher helper if present (keeps payload_version consistent)
+def _publish_batch(msgs):
+    """
+    Publishes queued (topic, obj, qos, retain) messages in order.
+    Resolves the ProductionPublisher helper once per batch (keeps payload_version consistent);
+    falls back to CirrusLink directly per message if that helper is unavailable or fails.
+    """
+    if not msgs:
+        return
+    pub = None
     try:
         import MagnaDataOps.ProductionPublisher as PUB
         if hasattr(PUB, "_publish"):
-            PUB._publish(topic, obj, qos, retain, None)
-            _LI("_publish", "Published via ProductionPublisher to %s" % topic)
-            return
-    except Exception as e:
-        _LW("_publish", "ProductionPublisher not used: %s" % _u(e))
-    # Fallback to CirrusLink directly
-    try:
-        payload = system.util.jsonEncode(obj).encode("utf-8")
-        system.cirruslink.engine.publish("Local Broker", topic, payload, int(qos), bool(retain))
-        _LI("_publish", "Published via CirrusLink to %s" % topic)
+            pub = PUB._publish
     except Exception as e:
-        _LE("_publish(CirrusLink)", exc=e)
+        _LW("_publish_batch", "ProductionPublisher not used: %s" % _u(e))
+
+    for topic, obj, qos, retain in msgs:
+        if pub is not None:
+            try:
+                pub(topic, obj, qos, retain, None)
+                continue
+            except Exception as e:
+                _LW("_publish_batch", "ProductionPublisher publish failed: %s" % _u(e))
+        # Fallback to CirrusLink directly
+        try:
+            payload = _json(obj).encode("utf-8")
+            system.cirruslink.engine.publish("Local Broker", topic, payload, int(qos), bool(retain))
+        except Exception as e:
+            _LE("_publish_batch(CirrusLink)", exc=e)
+    _LI("_publish_batch", "Published %d message(s)", len(msgs))
 
 # ----------------------- stations & history -----------------------
 def _load_stations():
+    ts, cached = _static["stations"]
+    if cached is not None and _fresh(ts):
+        return cached
     ds = None
     try:
         ds = system.db.runNamedQuery(MBASE + "getActiveStationsForOvercycle", {})
     except Exception as e:
         _LE("_load_stations", exc=e)
+        return []
     out = []
     for r in _rowdicts(ds):
         try:
@@ -163,98 +216,133 @@ def _load_stations():
             })
         except Exception:
             continue
+    _static["stations"] = (system.date.toMillis(system.date.now()), out)
     return out
 
 def _root(st):
     return u"[MagnaDataOps]MagnaStations/%s/%s/%s/%s" % (st["area"], st["subarea"], st["line"], st["station"])
 
-def _tag_exists(p):
-    try:
-        return bool(system.tag.exists(p))
-    except Exception:
-        return False
+# tag path -> exists; tag structure rarely changes, so re-check at most every _SHIFT_REFRESH_SEC
+_tag_cache = {"last_load": 0, "exists": {}}
 
-def _merge_histories(datasets):
-    """Merge multiple 'Wide' datasets with columns [ts, value] into a single time-ordered list of (ts, value)."""
-    rows = []
-    for ds in datasets:
-        if not ds:
-            continue
+def _tag_exists(p):
+    now_ms = system.date.toMillis(system.date.now())
+    if now_ms - _tag_cache["last_load"] >= _SHIFT_REFRESH_SEC * 1000:
+        _tag_cache["exists"] = {}
+        _tag_cache["last_load"] = now_ms
+    hit = _tag_cache["exists"].get(p)
+    if hit is None:
         try:
-            for i in range(ds.getRowCount()):
-                rows.append((ds.getValueAt(i, 0), ds.getValueAt(i, 1)))
+            hit = bool(system.tag.exists(p))
         except Exception:
-            pass
-    rows.sort(key=lambda t: system.date.toMillis(t[0]))
-    return rows
+            hit = False
+        _tag_cache["exists"][p] = hit
+    return hit
 
-def _query_ct_history(st, start, end):
+def _query_ct_history_bulk(stations, start, end):
     """
-    Returns the raw (Wide) history dataset for <station>/CycleTime between [start, end].
-    If missing/empty, returns None.
+    Reads <station>/CycleTime history between [start, end] for all given stations
+    with a single Tall-format queryTagHistory call.
+
+    Returns {sid: [(ts, value), ...]} for every station whose CycleTime tag exists
+    (list may be empty). Stations with a missing tag are absent from the result.
     """
+    out = {}
     try:
-        sid = int(st["station_id"])
-        p = _root(st) + u"/CycleTime"
-
-        if not _tag_exists(p):
-            _LW("_query_ct_history", "sid=%d path missing: %s" % (sid, _u(p)))
-            return None
-
+        paths, sid_by_path = [], {}
+        for st in stations:
+            sid = int(st["station_id"])
+            p = _root(st) + u"/CycleTime"
+            if not _tag_exists(p):
+                _LW("_query_ct_history_bulk", "sid=%d path missing: %s" % (sid, _u(p)))
+                continue
+            out[sid] = []
+            paths.append(p)
+            sid_by_path[p.lower()] = sid
+
+        if not paths:
+            return out
+
+        # Tall keeps each station's raw samples separate (Wide would carry values forward across columns)
         ds = system.tag.queryTagHistory(
-            paths=[p],
+            paths=paths,
             startDate=start,
             endDate=end,
             returnAggregated=False,
-            returnFormat='Wide',
+            returnFormat='Tall',
             includeBoundingValues=False
         )
 
-        if ds and ds.getRowCount() > 0:
-            _LI("_query_ct_history", "sid=%d found %d rows at %s" % (sid, ds.getRowCount(), _u(p)))
-            return ds
-
-        _LW("_query_ct_history", "sid=%d no rows for %s in [%s → %s]" % (sid, _u(p), _iso_sql(start), _iso_sql(end)))
-        return None
+        if ds:
+            c_path = ds.getColumnIndex("path")
+            c_val  = ds.getColumnIndex("value")
+            c_ts   = ds.getColumnIndex("timestamp")
+            for i in range(ds.getRowCount()):
+                sid = sid_by_path.get(_u(ds.getValueAt(i, c_path)).lower())
+                if sid is not None:
+                    out[sid].append((ds.getValueAt(i, c_ts), ds.getValueAt(i, c_val)))
+
+        for sid, rows in out.items():
+            if rows:
+                _LI("_query_ct_history_bulk", "sid=%d found %d rows", sid, len(rows))
+            else:
+                _LW("_query_ct_history_bulk", "sid=%d no rows in [%s → %s]" % (sid, _iso_sql(start), _iso_sql(end)))
+        return out
 
     except Exception as e:
-        _LE("_query_ct_history", exc=e)
-        return None
+        _LE("_query_ct_history_bulk", exc=e)
+        return out
 
-def _ct_segments(sid, start_ts, end_ts):
-    ds = None
-    try:
-        ds = system.db.runNamedQuery(
-            MBASE + "getCtSegmentsForStationBetween",
-            {"station_id": int(sid), "start_utc": start_ts, "end_utc": end_ts}
-        )
-    except Exception as e:
-        _LE("_ct_segments", exc=e)
-    segs = []
+def _add_ct_rows(by_sid, ds, sid=None):
+    """Append (effective_from_ms, ct_eff_sec, overcycle_multiplier) rows to by_sid; bad rows are skipped."""
     for r in _rowdicts(ds):
         try:
             ct   = float(r.get("ct_eff_sec") or 0.0)
             mult = float(r.get("overcycle_multiplier") or 2.0)
-            segs.append((r["effective_from_utc"], ct, mult))
+            t_ms = system.date.toMillis(r["effective_from_utc"])
+            by_sid.setdefault(int(sid if sid is not None else r["station_id"]), []).append((t_ms, ct, mult))
         except Exception:
             continue
-    segs.sort(key=lambda t: system.date.toMillis(t[0]))
-    return segs
-
-def _ct_at(ts, segs, i_hint):
-    tms = system.date.toMillis(ts)
-    i = i_hint if 0 <= i_hint < len(segs) else 0
-    while i + 1 < len(segs) and system.date.toMillis(segs[i + 1][0]) <= tms:
-        i += 1
-    while i > 0 and system.date.toMillis(segs[i][0]) > tms:
-        i -= 1
-    if not segs:
-        return (0.0, 2.0, i)
-    _, ct, mult = segs[i]
-    return (ct, mult, i)
+
+def _ct_segments_bulk(station_ids, start_ts, end_ts):
+    """
+    CT segments for all given stations in one NQ (getCtSegmentsForStationsBetween).
+    Falls back to getCtSegmentsForStationBetween per station if the bulk NQ fails, and keeps
+    using it for _SHIFT_REFRESH_SEC before retrying the bulk form.
+    Returns {sid: [(effective_from_ms, ct_eff_sec, overcycle_multiplier), ...]} sorted by time.
+    """
+    by_sid = {}
+    now_ms = system.date.toMillis(system.date.now())
+    bulk_ok = False
+    if now_ms >= _nq_state["ct_bulk_off_until"]:
+        try:
+            _add_ct_rows(by_sid, system.db.runNamedQuery(
+                MBASE + "getCtSegmentsForStationsBetween",
+                {"station_ids_csv": ",".join(str(int(s)) for s in station_ids),
+                 "start_utc": start_ts, "end_utc": end_ts}
+            ))
+            bulk_ok = True
+        except Exception as e:
+            _LW("_ct_segments_bulk", "Bulk CT NQ failed; querying per station. %s" % _u(e))
+            _nq_state["ct_bulk_off_until"] = now_ms + _SHIFT_REFRESH_SEC * 1000
+    if not bulk_ok:
+        for sid in station_ids:
+            try:
+                _add_ct_rows(by_sid, system.db.runNamedQuery(
+                    MBASE + "getCtSegmentsForStationBetween",
+                    {"station_id": int(sid), "start_utc": start_ts, "end_utc": end_ts}
+                ), sid)
+            except Exception as e:
+                _LE("_ct_segments_bulk", exc=e)
+    for segs in by_sid.values():
+        segs.sort(key=lambda t: t[0])
+    return by_sid
 
 # ----------------------- shifts (yesterday + today) -----------------------
 _shifts = {"last_load": 0, "today": None, "yday": None, "by_line": {}}
+# (line_id, shift_id, shift_start_ms) -> last as_of this process upserted station rows for;
+# saves the last-as-of NQs in steady state (cleared when the day rolls over)
+_ANCHOR = {}
 
 def _datestr(d):
     return system.date.format(d, "yyyy-MM-dd")
@@ -267,6 +355,8 @@ def _load_shifts_if_needed():
 
     if (now_ms - _shifts["last_load"] < _SHIFT_REFRESH_SEC * 1000) and _shifts["today"] == today:
         return
+    if _shifts["today"] != today:
+        _ANCHOR.clear()
 
     by_line = {}
 
@@ -295,7 +385,7 @@ def _load_shifts_if_needed():
     _shifts["last_load"] = now_ms
     _shifts["today"]     = today
     _shifts["yday"]      = yday
-    _LI("_load_shifts_if_needed", "Loaded shifts for %d lines" % len(by_line))
+    _LI("_load_shifts_if_needed", "Loaded shifts for %d lines", len(by_line))
 
 def _active_shift_for_line(line_id, now_ms):
     wins = _shifts["by_line"].get(int(line_id), [])
@@ -316,12 +406,84 @@ def _last_ended_shift_for_line(line_id, now_ms, grace_ms):
         return last
     return (None, None, None, None)
 
+# ----------------------- named-query helpers -----------------------
+# Per-tick memo for idempotent reads (cleared at the start of each tick and after station upserts)
+_tick_reads = {}
+# getShiftAccumForLine: after the shift_id variant fails, use the fallback form until this time
+# top-K NQs: after they fail, pick top-K from the full accum in Python until this time
+_nq_state = {"accum_no_shid_until": 0, "topk_off_until": 0, "ct_bulk_off_until": 0}
+
+def _nq_read(name, params):
+    """Runs a read-only NQ once per tick for a given parameter set; errors propagate (not cached)."""
+    key = (name, tuple(sorted(params.items())))
+    if key not in _tick_reads:
+        _tick_reads[key] = system.db.runNamedQuery(MBASE + name, params)
+    return _tick_reads[key]
+
+def _shift_accum(lid, shid, shift_start, as_of, where):
+    """getShiftAccumForLine with (line, shift) → falls back to the form without shift_id."""
+    now_ms = system.date.toMillis(system.date.now())
+    if now_ms >= _nq_state["accum_no_shid_until"]:
+        try:
+            return system.db.runNamedQuery(MBASE + "getShiftAccumForLine", {
+                "line_id": lid, "shift_id": int(shid),
+                "shift_start_local": shift_start, "as_of_local": as_of
+            })
+        except Exception as e1:
+            _LW("getShiftAccumForLine(%s)" % where, "Retrying without shift_id: %s" % _u(e1))
+            _nq_state["accum_no_shid_until"] = now_ms + _SHIFT_REFRESH_SEC * 1000
+    return system.db.runNamedQuery(MBASE + "getShiftAccumForLine", {
+        "line_id": lid, "shift_start_local": shift_start, "as_of_local": as_of
+    })
+
+def _acc_rows(ds):
+    """Accum dataset rows → [{"sid", "sum_over", "sum_cnt"}]; bad rows are skipped."""
+    acc = []
+    for r in _rowdicts(ds):
+        try:
+            sid = int(r["station_id"])
+            acc.append({
+                "sid": sid,
+                "sum_over": float(r.get("over_sec_sum_shift") or 0.0),
+                "sum_cnt":  int(r.get("over_count_shift") or 0)
+            })
+        except Exception:
+            pass
+    return acc
+
+def _shift_top_k(lid, shid, shift_start, as_of, where):
+    """
+    Top-_MAX_TOP stations by over time and by over count, ordered and limited in the DB
+    (getShiftTopOverTimesForLine / getShiftTopOverCountsForLine; ties broken on the other sum).
+    Returns (top_tim, top_tot), or None if those NQs are unavailable.
+    """
+    now_ms = system.date.toMillis(system.date.now())
+    if now_ms < _nq_state["topk_off_until"]:
+        return None
+    params = {
+        "line_id": lid, "shift_id": int(shid),
+        "shift_start_local": shift_start, "as_of_local": as_of, "k": _MAX_TOP
+    }
+    try:
+        top_tim = _acc_rows(system.db.runNamedQuery(MBASE + "getShiftTopOverTimesForLine", params))
+        top_tot = _acc_rows(system.db.runNamedQuery(MBASE + "getShiftTopOverCountsForLine", params))
+    except Exception as e:
+        _LW("_shift_top_k(%s)" % where, "Top-K NQs failed; using full accum. %s" % _u(e))
+        _nq_state["topk_off_until"] = now_ms + _SHIFT_REFRESH_SEC * 1000
+        return None
+    return (top_tim[:_MAX_TOP], top_tot[:_MAX_TOP])
+
 # ----------------------- delta anchors & fallbacks -----------------------
 def _line_last_asof(lid, shid, shift_start):
     """
     Try NQ with (line_id, shift_id). If that fails or returns NULL,
     fall back to max(as_of_local) from existing per-station rows for the same shift.
+    Anchors this process wrote itself are served from _ANCHOR without a query.
     """
+    anchor = _ANCHOR.get((lid, int(shid), system.date.toMillis(shift_start)))
+    if anchor is not None:
+        return anchor
+
     # primary
     try:
         ds = system.db.runNamedQuery(MBASE + "getLineLastAsOfForShift", {"line_id": lid, "shift_id": shid})
@@ -334,15 +496,17 @@ def _line_last_asof(lid, shid, shift_start):
 
     # fallback: derive from station cumulative rows
     try:
-        ds2 = system.db.runNamedQuery(
-            MBASE + "getStationCumForShiftByLine",
+        ds2 = _nq_read(
+            "getStationCumForShiftByLine",
             {"line_id": lid, "shift_id": shid, "shift_start_local": shift_start}
         )
-        best = None
+        best, best_ms = None, None
         for r in _rowdicts(ds2):
             t = r.get("as_of_local")
-            if t and (best is None or system.date.toMillis(t) > system.date.toMillis(best)):
-                best = t
+            if t:
+                t_ms = system.date.toMillis(t)
+                if best_ms is None or t_ms > best_ms:
+                    best, best_ms = t, t_ms
         return best or shift_start
     except Exception as e:
         _LW("_line_last_asof", "Fallback NQ failed; defaulting to shift_start. %s" % _u(e))
@@ -351,8 +515,8 @@ def _line_last_asof(lid, shid, shift_start):
 def _existing_station_rows(lid, shid, shift_start):
     ds = None
     try:
-        ds = system.db.runNamedQuery(
-            MBASE + "getStationCumForShiftByLine",
+        ds = _nq_read(
+            "getStationCumForShiftByLine",
             {"line_id": lid, "shift_id": shid, "shift_start_local": shift_start}
         )
     except Exception as e:
@@ -366,11 +530,81 @@ def _existing_station_rows(lid, shid, shift_start):
     return out
 
 # ----------------------- delta compute -----------------------
+def _classify_octs(hist, segs):
+    """
+    Classifies raw CycleTime samples against CT segments.
+    Valid OCT: ct > 0 and ct < act <= ct*mult (longer cycles are idle/changeover).
+    Returns (count, sum_over_sec, max_over_sec).
+    """
+    cnt = 0
+    mx  = 0.0
+    sum_over = 0.0
+    if not segs:
+        return (cnt, sum_over, mx)
+
+    # Per-segment (ct, lower, upper) bounds resolved once; None = segment has no usable CT
+    segs_ms = [sg[0] for sg in segs]
+    bounds = []
+    for _, ct, mult in segs:
+        if ct <= 0.0:
+            bounds.append(None)
+        else:
+            bounds.append((ct, ct * (1.0 + EPSILON) if EPSILON > 0.0 else ct, ct * mult))
+
+    to_ms = system.date.toMillis
+    find  = bisect.bisect_right
+    for ts, val in hist:
+        i = find(segs_ms, to_ms(ts)) - 1
+        bnd = bounds[i if i > 0 else 0]
+        if bnd is None:
+            continue
+        try:
+            act = float(val)
+        except Exception:
+            continue
+
+        ct, lo, hi = bnd
+        # very long cycles (> ct*mult) are treated as non-OCT (idle/changeover)
+        if act <= ct or act < lo or act > hi:
+            continue
+
+        over = act - ct
+        cnt += 1
+        sum_over += over
+        if over > mx:
+            mx = over
+    return (cnt, sum_over, mx)
+
+def _oct_rollup_for_line(line_id, a, b):
+    """
+    Per-station OCT sums over [a, b) from the DB-side rollup (oct_station_minute), which is
+    maintained outside this script and already classifies each cycle against its CT segment.
+    Returns {sid: (count, sum_over_sec, max_over_sec)}, or None if the NQ fails.
+    """
+    try:
+        ds = system.db.runNamedQuery(MBASE + "getOctDeltaByLineBetween", {
+            "line_id": int(line_id), "start_local": a, "end_local": b
+        })
+    except Exception as e:
+        _LW("_oct_rollup_for_line", "Rollup NQ failed; classifying raw history. %s" % _u(e))
+        return None
+    out = {}
+    for r in _rowdicts(ds):
+        try:
+            out[int(r["station_id"])] = (
+                int(r.get("over_cnt") or 0),
+                float(r.get("over_sec_sum") or 0.0),
+                float(r.get("max_over_sec") or 0.0),
+            )
+        except Exception:
+            continue
+    return out
+
 def _compute_deltas_for_line(stations_on_line, shift_id, shift_date, shift_start, a, b, shift_end, include_zero_for=set()):
     """
     Computes OCT deltas between [a, b] for every station on the line.
 
-    - Reads ONLY <station>/CycleTime history.
+    - Reads ONLY <station>/CycleTime history (or the DB rollup when USE_DB_OCT_ROLLUP is on).
     - Uses CT segments to gate valid OCT (act > ct and act <= ct*mult).
     - Emits a row (with delta counts/sums) when there is any OCT in [a, b].
     - Also emits a **zero** row when either:
@@ -383,58 +617,57 @@ def _compute_deltas_for_line(stations_on_line, shift_id, shift_date, shift_start
     """
     rows   = []
     scanned = kept = 0
+    to_ms = system.date.toMillis
+
+    # per-window constants shared by every row
+    ss_iso, se_iso = _iso_sql(shift_start), _iso_sql(shift_end)
+    a_iso,  b_iso  = _iso_sql(a), _iso_sql(b)
+    shid_i, sday_u = int(shift_id), _u(shift_date)
+    window_minutes = int(round((to_ms(b) - to_ms(shift_start)) / 60000.0))
+
+    # Pre-classified sums from the DB rollup when enabled; None => classify raw history here
+    rollup = _oct_rollup_for_line(stations_on_line[0]["line_id"], a, b) if (USE_DB_OCT_ROLLUP and stations_on_line) else None
+
+    if rollup is None:
+        # only instrumented stations need history/segments; the rest can at most seed a zero row
+        ct_sts = [st for st in stations_on_line if _tag_exists(_root(st) + u"/CycleTime")]
+        if ct_sts:
+            # one historian round-trip + one segment NQ for the whole line
+            hist_by_sid = _query_ct_history_bulk(ct_sts, a, b)
+            segs_by_sid = _ct_segments_bulk([st["station_id"] for st in ct_sts], a, b)
+        else:
+            hist_by_sid = segs_by_sid = {}
+    else:
+        hist_by_sid = segs_by_sid = {}
 
     for st in stations_on_line:
         scanned += 1
         sid = int(st["station_id"])
         lid = int(st["line_id"])
 
-        segs = _ct_segments(sid, a, b)
-        ds   = _query_ct_history(st, a, b)
-        has_ct_tag = _tag_exists(_root(st) + u"/CycleTime")
-        seed_zero  = (sid in include_zero_for) or has_ct_tag
-
-        cnt = 0
-        mx  = 0.0
-        sum_over = 0.0
-        idx = 0
-
-        if segs and ds:
-            for i in range(ds.getRowCount()):
-                ts = ds.getValueAt(i, 0)
-                try:
-                    act = float(ds.getValueAt(i, 1))
-                except Exception:
-                    continue
-
-                ct, mult, idx = _ct_at(ts, segs, idx)
-                if ct <= 0.0:
-                    continue
-                if act <= ct:
-                    continue
-                if act > ct * mult:
-                    # very long cycles treated as non-OCT (idle/changeover)
-                    continue
-                if EPSILON > 0.0 and act < ct * (1.0 + EPSILON):
-                    continue
+        segs = segs_by_sid.get(sid, [])
+        hist = hist_by_sid.get(sid)
 
-                over = act - ct
-                cnt += 1
-                sum_over += over
-                if over > mx:
-                    mx = over
+        if rollup is None:
+            has_ct_tag = hist is not None
+            if not has_ct_tag and sid not in include_zero_for:
+                continue
+            cnt, sum_over, mx = _classify_octs(hist, segs) if (segs and hist) else (0, 0.0, 0.0)
+        else:
+            has_ct_tag = _tag_exists(_root(st) + u"/CycleTime")
+            cnt, sum_over, mx = rollup.get(sid, (0, 0.0, 0.0))
+        seed_zero  = (sid in include_zero_for) or has_ct_tag
 
         # Decide whether to emit a row
         if cnt > 0 or sum_over > 0.0 or seed_zero:
-            window_minutes = int(round((system.date.toMillis(b) - system.date.toMillis(shift_start)) / 60000.0))
             rows.append({
                 "line_id": lid,
                 "station_id": sid,
-                "shift_id": int(shift_id),
-                "shift_date": _u(shift_date),
-                "shift_start_local": _iso_sql(shift_start),
-                "shift_end_local":   _iso_sql(shift_end),
-                "as_of_local":       _iso_sql(b),
+                "shift_id": shid_i,
+                "shift_date": sday_u,
+                "shift_start_local": ss_iso,
+                "shift_end_local":   se_iso,
+                "as_of_local":       b_iso,
 
                 # DELTAS for SP:
                 "inc_over_cnt":      int(cnt),
@@ -447,18 +680,108 @@ def _compute_deltas_for_line(stations_on_line, shift_id, shift_date, shift_start
             kept += 1
 
         _LI("_station_debug",
-            "lid=%d sid=%d segs=%d hist_rows=%s window=[%s → %s] -> kept=%s cnt=%d sum=%.3f mx=%.3f" %
-            (lid, sid, len(segs),
-             (ds.getRowCount() if ds else "0"),
-             _iso_sql(a), _iso_sql(b),
-             "Y" if (cnt > 0 or sum_over > 0.0 or seed_zero) else "N",
-             cnt, sum_over, mx))
+            "lid=%d sid=%d segs=%d hist_rows=%s window=[%s → %s] -> kept=%s cnt=%d sum=%.3f mx=%.3f",
+            lid, sid, len(segs),
+            (len(hist) if hist else "0"),
+            a_iso, b_iso,
+            "Y" if (cnt > 0 or sum_over > 0.0 or seed_zero) else "N",
+            cnt, sum_over, mx)
 
     _LI("_compute_deltas_for_line",
-        "Scanned %d stations, produced %d delta rows for [%s → %s]" %
-        (scanned, kept, _iso_sql(a), _iso_sql(b)))
+        "Scanned %d stations, produced %d delta rows for [%s → %s]",
+        scanned, kept, a_iso, b_iso)
     return rows
 
+# ----------------------- line totals / snapshot -----------------------
+def _any_h_for_line(H, acc_list, sts_list):
+    """Pick some hierarchy for the line even if the accum list is empty."""
+    try:
+        if acc_list:
+            h = H.get(int(acc_list[0]["sid"]))
+            if h:
+                return h
+        if sts_list:
+            st0 = sts_list[0]
+            return (H.get(int(st0["station_id"])) or
+                    {"area": _u(st0["area"]), "subarea": _u(st0["subarea"]), "line": _u(st0["line"])})
+    except Exception:
+        pass
+    return None
+
+def _publish_and_snapshot(lid, sts, shid, sday, shift_start, shift_end, as_of, is_final,
+                          H, ts_iso, topic_prefix, pending, snaps):
+    """
+    Build top lists from the DB accum as of `as_of`, queue the MQTT publishes
+    and queue the line snapshot row (final or current) onto `snaps`.
+    """
+    where = "final" if is_final else "current"
+    try:
+        # top lists (possibly empty): DB-side top-K, else pick from the full line accum
+        tops = _shift_top_k(lid, shid, shift_start, as_of, where)
+        if tops is not None:
+            top_tim, top_tot = tops
+        else:
+            acc = _acc_rows(_shift_accum(lid, shid, shift_start, as_of, where))
+            top_tim = heapq.nlargest(_MAX_TOP, acc, key=lambda x: (x["sum_over"], x["sum_cnt"]))
+            top_tot = heapq.nlargest(_MAX_TOP, acc, key=lambda x: (x["sum_cnt"], x["sum_over"]))
+
+        # (name, display value) per rank; shared by the MQTT payloads and the snapshot row
+        # display names resolved only for the ranked stations, once per sid
+        names = dict((r["sid"], _station_name(H, r["sid"])) for r in top_tim + top_tot)
+        tim_vals = [(names[r["sid"]], _fmt_mmss(r["sum_over"])) for r in top_tim]
+        tot_vals = [(names[r["sid"]], int(r["sum_cnt"])) for r in top_tot]
+
+        h_any = _any_h_for_line(H, top_tim or top_tot, sts)
+        if h_any:
+            oc_tim = {"Overcycles": [
+                {"ID": i + 1, "StnID": n, "Value": v}
+                for i, (n, v) in enumerate(tim_vals)
+            ]}
+            oc_tot = {"Overcycles": [
+                {"ID": i + 1, "StnID": n, "Value": v}
+                for i, (n, v) in enumerate(tot_vals)
+            ]}
+            if not is_final:
+                # current payloads also carry the line/shift ids
+                for oc in (oc_tim, oc_tot):
+                    oc["LineId"] = u"%d" % lid
+                    oc["ShiftId"] = int(shid)
+            pay_tim = {"Version": payload_version, "Timestamp": ts_iso, "TopOvercycles": oc_tim}
+            pay_tot = {"Version": payload_version, "Timestamp": ts_iso, "TopOvercycles": oc_tot}
+
+            prefix = topic_prefix.get(lid)
+            if prefix is None:
+                prefix = topic_prefix[lid] = _topic_prefix(h_any)
+            pending.append((prefix + "TopOvercycleTotals", pay_tot, 0, False))
+            pending.append((prefix + "TopOvercycleTimes",  pay_tim, 0, False))
+        else:
+            _LW(where, "No hierarchy for line %d; skipping MQTT publish." % lid)
+
+        # line snapshot row (upserted with the rest of the tick's snapshots)
+        try:
+            slot_minutes = int(round((system.date.toMillis(as_of) - system.date.toMillis(shift_start)) / 60000.0))
+            snapshot = {
+                "line_id": lid, "shift_id": int(shid), "shift_date": _u(sday),
+                "shift_start_local": _iso_sql(shift_start),
+                "shift_end_local":   _iso_sql(shift_end),
+                "as_of_local":       _iso_sql(as_of),
+                "is_published":      0 if is_final else 1,
+                "is_final":          1 if is_final else 0,
+                "slot_duration_min": slot_minutes,
+                "top_totals_json":   _json(
+                    [{"id": i + 1, "station": n, "value": v} for i, (n, v) in enumerate(tot_vals)]
+                ),
+                "top_times_json":    _json(
+                    [{"id": i + 1, "station": n, "value": v} for i, (n, v) in enumerate(tim_vals)]
+                )
+            }
+            snaps.append(snapshot)
+        except Exception as e:
+            _LE("line_snapshot(%s)" % where, exc=e)
+
+    except Exception as e:
+        _LE("%s_snapshot" % where, exc=e)
+
 # ----------------------- main -----------------------
 def run_overcycle():
     """
@@ -467,6 +790,11 @@ def run_overcycle():
         OCT.run_overcycle()
     """
     _LI("run_overcycle", "START")
+    pending = []   # (topic, obj, qos, retain) flushed once at the end of the tick
+    snaps   = []   # line snapshot rows, upserted in one upsertSlotLineBatch at the end of the tick
+    _tick_reads.clear()
+    to_ms, from_ms = system.date.toMillis, system.date.fromMillis
+    run_nq, json_enc = system.db.runNamedQuery, _json
     try:
         _load_shifts_if_needed()
 
@@ -476,7 +804,7 @@ def run_overcycle():
             return
 
         now    = system.date.now()
-        now_ms = system.date.toMillis(now)
+        now_ms = to_ms(now)
         ts_iso = _iso_off(now)
         grace_ms = _FINAL_GRACE_MIN * 60 * 1000
 
@@ -488,23 +816,10 @@ def run_overcycle():
         for st in stations:
             by_line.setdefault(int(st["line_id"]), []).append(st)
 
-        _LI("run_overcycle", "Processing %d lines" % len(by_line))
+        _LI("run_overcycle", "Processing %d lines", len(by_line))
 
-        # helper to choose some hierarchy for the line even if accum list is empty
-        def _any_h_for_line(acc_list, sts_list):
-            try:
-                if acc_list:
-                    sid = acc_list[0]["sid"]
-                    h = H.get(int(sid))
-                    if h:
-                        return h
-                if sts_list:
-                    st0 = sts_list[0]
-                    return (H.get(int(st0["station_id"])) or
-                            {"area": _u(st0["area"]), "subarea": _u(st0["subarea"]), "line": _u(st0["line"])})
-            except Exception:
-                pass
-            return None
+        # line id -> MQTT topic prefix (built once per line per tick)
+        topic_prefix = {}
 
         for lid, sts in by_line.items():
 
@@ -512,15 +827,15 @@ def run_overcycle():
             prev = _last_ended_shift_for_line(lid, now_ms, grace_ms)
             if prev[0] is not None:
                 shid, sday, s_ms, e_ms = prev
-                shift_start = system.date.fromMillis(s_ms)
-                shift_end   = system.date.fromMillis(e_ms)
+                shift_start = from_ms(s_ms)
+                shift_end   = from_ms(e_ms)
                 last_asof   = _line_last_asof(lid, shid, shift_start) or shift_start
 
-                _LI("finalize", "Line %d shift %d last_as_of=%s end=%s" %
-                    (lid, shid, _iso_sql(last_asof), _iso_sql(shift_end)))
+                _LI("finalize", "Line %d shift %d last_as_of=%s end=%s",
+                    lid, shid, _iso_sql(last_asof), _iso_sql(shift_end))
 
                 # catch-up delta to the shift end
-                if system.date.toMillis(last_asof) < system.date.toMillis(shift_end):
+                if to_ms(last_asof) < to_ms(shift_end):
                     existed = _existing_station_rows(lid, shid, shift_start)
                     delta_rows = _compute_deltas_for_line(
                         sts, shid, sday, shift_start, last_asof, shift_end, shift_end, include_zero_for=existed
@@ -529,115 +844,33 @@ def run_overcycle():
                         r["is_final"] = 1
                     if delta_rows:
                         try:
-                            system.db.runNamedQuery(MBASE + "upsertSlotStationBatch", {
-                                "payload": system.util.jsonEncode(delta_rows),
+                            run_nq(MBASE + "upsertSlotStationBatch", {
+                                "payload": json_enc(delta_rows),
                                 "created_by": "OvercyclePublisher"
                             })
-                            _LI("finalize", "Upserted %d station cum rows (final)" % len(delta_rows))
+                            _tick_reads.clear()   # station cum rows changed
+                            _ANCHOR[(lid, int(shid), s_ms)] = shift_end
+                            _LI("finalize", "Upserted %d station cum rows (final)", len(delta_rows))
                         except Exception as e:
                             _LE("upsertSlotStationBatch(final)", exc=e)
 
-                # build totals from DB accum and publish
-                try:
-                    try:
-                        ds_acc = system.db.runNamedQuery(MBASE + "getShiftAccumForLine", {
-                            "line_id": lid, "shift_id": int(shid),
-                            "shift_start_local": shift_start, "as_of_local": shift_end
-                        })
-                    except Exception as e1:
-                        _LW("getShiftAccumForLine(final)", "Retrying without shift_id: %s" % _u(e1))
-                        ds_acc = system.db.runNamedQuery(MBASE + "getShiftAccumForLine", {
-                            "line_id": lid, "shift_start_local": shift_start, "as_of_local": shift_end
-                        })
-
-                    acc = []
-                    for r in _rowdicts(ds_acc):
-                        try:
-                            acc.append({
-                                "sid": int(r["station_id"]),
-                                "sum_over": float(r.get("over_sec_sum_shift") or 0.0),
-                                "sum_cnt":  int(r.get("over_count_shift") or 0)
-                            })
-                        except Exception:
-                            pass
-
-                    # top lists (possibly empty)
-                    top_tim = sorted(acc, key=lambda x: (x["sum_over"], x["sum_cnt"]), reverse=True)[:_MAX_TOP] if acc else []
-                    top_tot = sorted(acc, key=lambda x: (x["sum_cnt"], x["sum_over"]), reverse=True)[:_MAX_TOP] if acc else []
-
-                    h_any = _any_h_for_line(acc, sts)
-                    if h_any:
-                        def _name(sid):
-                            return (H.get(sid, {}) or {}).get("station") or u"Station_%d" % sid
-
-                        pay_tim = {
-                            "Version": payload_version, "Timestamp": ts_iso,
-                            "TopOvercycles": {
-                                "Overcycles": [
-                                    {"ID": i + 1, "StnID": _name(r["sid"]), "Value": _fmt_mmss(r["sum_over"])}
-                                    for i, r in enumerate(top_tim)
-                                ]
-                            }
-                        }
-                        pay_tot = {
-                            "Version": payload_version, "Timestamp": ts_iso,
-                            "TopOvercycles": {
-                                "Overcycles": [
-                                    {"ID": i + 1, "StnID": _name(r["sid"]), "Value": int(r["sum_cnt"])}
-                                    for i, r in enumerate(top_tot)
-                                ]
-                            }
-                        }
-
-                        _publish(_topic_for_line(h_any, "TopOvercycleTotals"), pay_tot, qos=0, retain=False)
-                        _publish(_topic_for_line(h_any, "TopOvercycleTimes"),  pay_tim, qos=0, retain=False)
-                    else:
-                        _LW("finalize", "No hierarchy for line %d; skipping MQTT publish." % lid)
-
-                    # final snapshot row
-                    try:
-                        slot_minutes_final = int(round((system.date.toMillis(shift_end) - system.date.toMillis(shift_start)) / 60000.0))
-                        system.db.runNamedQuery(MBASE + "upsertSlotLineBatch", {
-                            "payload": system.util.jsonEncode([{
-                                "line_id": lid, "shift_id": int(shid), "shift_date": _u(sday),
-                                "shift_start_local": _iso_sql(shift_start),
-                                "shift_end_local":   _iso_sql(shift_end),
-                                "as_of_local":       _iso_sql(shift_end),
-                                "is_final":          1,
-                                "slot_duration_min": slot_minutes_final,
-                                "is_published":      0,
-                                "top_totals_json":   system.util.jsonEncode(
-                                    [{"id": i + 1, "station": (H.get(r["sid"], {}) or {}).get("station", u"Station_%d" % r["sid"]), "value": int(r["sum_cnt"])}
-                                     for i, r in enumerate(top_tot)]
-                                ),
-                                "top_times_json":    system.util.jsonEncode(
-                                    [{"id": i + 1, "station": (H.get(r["sid"], {}) or {}).get("station", u"Station_%d" % r["sid"]), "value": _fmt_mmss(r["sum_over"])}
-                                     for i, r in enumerate(top_tim)]
-                                )
-                            }]),
-                            "created_by": "OvercyclePublisher"
-                        })
-                        _LI("finalize", "Inserted final line snapshot for line %d shift %d" % (lid, shid))
-                    except Exception as e:
-                        _LE("upsertSlotLineBatch(final)", exc=e)
-
-                except Exception as e:
-                    _LE("final_snapshot", exc=e)
+                _publish_and_snapshot(lid, sts, shid, sday, shift_start, shift_end, shift_end, True,
+                                      H, ts_iso, topic_prefix, pending, snaps)
 
             # ---------- 2) current active shift ----------
             cur = _active_shift_for_line(lid, now_ms)
             if cur[0] is not None:
                 shid, sday, s_ms, e_ms = cur
-                shift_start = system.date.fromMillis(s_ms)
-                shift_end   = system.date.fromMillis(e_ms)
+                shift_start = from_ms(s_ms)
+                shift_end   = from_ms(e_ms)
                 as_of       = now if now_ms < e_ms else shift_end
                 last_asof   = _line_last_asof(lid, shid, shift_start) or shift_start
 
-                _LI("current", "Line %d shift %d delta [%s → %s]" %
-                    (lid, shid, _iso_sql(last_asof), _iso_sql(as_of)))
+                _LI("current", "Line %d shift %d delta [%s → %s]",
+                    lid, shid, _iso_sql(last_asof), _iso_sql(as_of))
 
                 # delta since last_asof
-                if system.date.toMillis(as_of) > system.date.toMillis(last_asof):
+                if to_ms(as_of) > to_ms(last_asof):
                     existed = _existing_station_rows(lid, shid, shift_start)
                     delta_rows = _compute_deltas_for_line(
                         sts, shid, sday, shift_start, last_asof, as_of, shift_end, include_zero_for=existed
@@ -646,103 +879,33 @@ def run_overcycle():
                         r["is_final"] = 0
                     if delta_rows:
                         try:
-                            system.db.runNamedQuery(MBASE + "upsertSlotStationBatch", {
-                                "payload": system.util.jsonEncode(delta_rows),
+                            run_nq(MBASE + "upsertSlotStationBatch", {
+                                "payload": json_enc(delta_rows),
                                 "created_by": "OvercyclePublisher"
                             })
-                            _LI("current", "Upserted %d station cum rows (current)" % len(delta_rows))
+                            _tick_reads.clear()   # station cum rows changed
+                            _ANCHOR[(lid, int(shid), s_ms)] = as_of
+                            _LI("current", "Upserted %d station cum rows (current)", len(delta_rows))
                         except Exception as e:
                             _LE("upsertSlotStationBatch(current)", exc=e)
 
-                # build current snapshot and publish
-                try:
-                    try:
-                        ds_acc = system.db.runNamedQuery(MBASE + "getShiftAccumForLine", {
-                            "line_id": lid, "shift_id": int(shid),
-                            "shift_start_local": shift_start, "as_of_local": as_of
-                        })
-                    except Exception as e1:
-                        _LW("getShiftAccumForLine(current)", "Retrying without shift_id: %s" % _u(e1))
-                        ds_acc = system.db.runNamedQuery(MBASE + "getShiftAccumForLine", {
-                            "line_id": lid, "shift_start_local": shift_start, "as_of_local": as_of
-                        })
-
-                    acc = []
-                    for r in _rowdicts(ds_acc):
-                        try:
-                            acc.append({
-                                "sid": int(r["station_id"]),
-                                "sum_over": float(r.get("over_sec_sum_shift") or 0.0),
-                                "sum_cnt":  int(r.get("over_count_shift") or 0)
-                            })
-                        except Exception:
-                            pass
-
-                    top_tim = sorted(acc, key=lambda x: (x["sum_over"], x["sum_cnt"]), reverse=True)[:_MAX_TOP] if acc else []
-                    top_tot = sorted(acc, key=lambda x: (x["sum_cnt"], x["sum_over"]), reverse=True)[:_MAX_TOP] if acc else []
-
-                    h_any = _any_h_for_line(acc, sts)
-                    if h_any:
-                        def _name(sid):
-                            return (H.get(sid, {}) or {}).get("station") or u"Station_%d" % sid
-
-                        pay_tim = {
-                            "Version": payload_version, "Timestamp": _iso_off(now),
-                            "TopOvercycles": {
-                                "LineId": u"%d" % lid, "ShiftId": int(shid),
-                                "Overcycles": [
-                                    {"ID": i + 1, "StnID": _name(r["sid"]), "Value": _fmt_mmss(r["sum_over"])}
-                                    for i, r in enumerate(top_tim)
-                                ]
-                            }
-                        }
-                        pay_tot = {
-                            "Version": payload_version, "Timestamp": _iso_off(now),
-                            "TopOvercycles": {
-                                "LineId": u"%d" % lid, "ShiftId": int(shid),
-                                "Overcycles": [
-                                    {"ID": i + 1, "StnID": _name(r["sid"]), "Value": int(r["sum_cnt"])}
-                                    for i, r in enumerate(top_tot)
-                                ]
-                            }
-                        }
-
-                        _publish(_topic_for_line(h_any, "TopOvercycleTotals"), pay_tot, qos=0, retain=False)
-                        _publish(_topic_for_line(h_any, "TopOvercycleTimes"),  pay_tim, qos=0, retain=False)
-                    else:
-                        _LW("current", "No hierarchy for line %d; skipping MQTT publish." % lid)
-
-                    # current snapshot row
-                    try:
-                        slot_minutes_current = int(round((system.date.toMillis(as_of) - system.date.toMillis(shift_start)) / 60000.0))
-                        system.db.runNamedQuery(MBASE + "upsertSlotLineBatch", {
-                            "payload": system.util.jsonEncode([{
-                                "line_id": lid, "shift_id": int(shid), "shift_date": _u(sday),
-                                "shift_start_local": _iso_sql(shift_start),
-                                "shift_end_local":   _iso_sql(shift_end),
-                                "as_of_local":       _iso_sql(as_of),
-                                "is_published":      1,
-                                "is_final":          0,
-                                "slot_duration_min": slot_minutes_current,
-                                "top_totals_json":   system.util.jsonEncode(
-                                    [{"id": i + 1, "station": (H.get(r["sid"], {}) or {}).get("station", u"Station_%d" % r["sid"]), "value": int(r["sum_cnt"])}
-                                     for i, r in enumerate(top_tot)]
-                                ),
-                                "top_times_json":    system.util.jsonEncode(
-                                    [{"id": i + 1, "station": (H.get(r["sid"], {}) or {}).get("station", u"Station_%d" % r["sid"]), "value": _fmt_mmss(r["sum_over"])}
-                                     for i, r in enumerate(top_tim)]
-                                )
-                            }]),
-                            "created_by": "OvercyclePublisher"
-                        })
-                        _LI("current", "Inserted current line snapshot for line %d shift %d" % (lid, shid))
-                    except Exception as e:
-                        _LE("upsertSlotLineBatch(current)", exc=e)
-
-                except Exception as e:
-                    _LE("current_snapshot", exc=e)
+                _publish_and_snapshot(lid, sts, shid, sday, shift_start, shift_end, as_of, False,
+                                      H, ts_iso, topic_prefix, pending, snaps)
 
     except Exception as e:
         _LE("run_overcycle", exc=e)
     finally:
+        if snaps:
+            try:
+                run_nq(MBASE + "upsertSlotLineBatch", {
+                    "payload": json_enc(snaps),
+                    "created_by": "OvercyclePublisher"
+                })
+                _LI("run_overcycle", "Upserted %d line snapshot row(s)", len(snaps))
+            except Exception as e:
+                _LE("upsertSlotLineBatch", exc=e)
+        try:
+            _publish_batch(pending)
+        except Exception as e:
+            _LE("run_overcycle(publish)", exc=e)
         _LI("run_overcycle", "END")
\ No newline at end of file
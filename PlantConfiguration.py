@@ -6,13 +6,19 @@
 
 # ───── Imports ───────────────────────────────────────────────────────────
 import system
+from collections import defaultdict
 from system.dataset import toDataSet
+from java.util.concurrent import ConcurrentLinkedQueue
 from MagnaDataOps.LoggerFunctions import log_info, log_warn, log_error
 
 
 # ───── Small utilities (keep Jython-safe) ────────────────────────────────
 _CONN   = "Ignition OPC UA Server"
 _OUTTAG = "[MagnaDataOps]InstanceSetup/StationMetaData"
+_SCAN_WORKERS = 4   # max devices scanned concurrently
+# Per-root detail in the Status column (False = one "TT roots=N fx=M" summary per station)
+_STATUS_VERBOSE = True
+_HIER_NQ_BASE = "MagnaDataOps/Configuration/PlantConfiguration/HierarchyConfiguration/Additional/"
 
 _HEADERS = [
     "Area", "SubArea", "Line", "Station",
@@ -20,34 +26,91 @@ _HEADERS = [
     "Device", "StationIDX"
 ]
 
+# (type, value) -> unicode for the small set of scalars the scan sees over and over
+_STR_CACHE = {}
+_STR_CACHE_MAX = 1024
+_STR_CACHEABLE = (str, int, long, bool)
+
+# station_name -> (AREA, SUBAREA, LINE, STATION); reset at the start of each scan
+_HIER_CACHE = {}
+
 def _safe_str(x):
+    if x is None:
+        return u""
+    if isinstance(x, unicode):
+        return x
+    key = (type(x), x) if isinstance(x, _STR_CACHEABLE) else None
+    if key is not None:
+        hit = _STR_CACHE.get(key)
+        if hit is not None:
+            return hit
     try:
-        return unicode(x) if x is not None else u""
+        s = unicode(x)
     except Exception:
-        return unicode(str(x) if x is not None else u"")
+        s = unicode(str(x))
+    if key is not None and len(_STR_CACHE) < _STR_CACHE_MAX:
+        _STR_CACHE[key] = s
+    return s
 
-def _read_safe(opc_path):
-    """Return value if quality good, else None. Never throws."""
+# OPC server state, checked once per scan; when down, reads return None without a round trip
+_conn_state = {"ok": True}
+
+def _check_connection():
     try:
-        qv = system.opc.readValue(_CONN, opc_path)
-        return qv.value if qv.quality.isGood() else None
+        _conn_state["ok"] = (_safe_str(system.opc.getServerState(_CONN)).upper() == u"CONNECTED")
     except Exception:
-        return None
+        _conn_state["ok"] = True   # state unknown: let the reads decide
+    return _conn_state["ok"]
+
+def _read_many(opc_paths):
+    """One OPC round trip for many paths; list of values (None where quality not good). Never throws."""
+    if not opc_paths:
+        return []
+    if not _conn_state["ok"]:
+        return [None] * len(opc_paths)
+    try:
+        qvs = system.opc.readValues(_CONN, opc_paths)
+        return [qv.value if qv.quality.isGood() else None for qv in qvs]
+    except Exception:
+        return [None] * len(opc_paths)
+
+_BOOL_TRUE = frozenset((u"true", u"1", u"yes"))
 
 def _boolish(v):
-    """Loose bool parse used in original code."""
-    s = _safe_str(v).strip().lower()
-    return s in (u"true", u"1", u"yes")
+    """Loose bool parse used in original code (native bool/int fast path)."""
+    if v is True:
+        return True
+    if v is False or v is None:
+        return False
+    if type(v) in (int, long):
+        return v == 1
+    try:
+        return v.strip().lower() in _BOOL_TRUE
+    except Exception:
+        return _safe_str(v).strip().lower() in _BOOL_TRUE
+
+def _fld_root(prefix, a, b):
+    """OPC path of FLD[a,b] from a per-device prefix built by _fld_prefix (plain concatenation)."""
+    return prefix + str(a) + "," + str(b) + "]"
+
+def _fld_prefix(device):
+    return "ns=1;s=[" + _safe_str(device) + "]FLD["
+
+def _scan_lineid_grid(device, max_a=50, probe_b_range=5):
+    """Read the whole FLD[a,b].LineID probe grid once. Returns {(a,b): value_or_None}."""
+    cells = [(a, b) for a in range(max_a) for b in range(probe_b_range)]
+    prefix = _fld_prefix(device)
+    vals = _read_many([_fld_root(prefix, a, b) + ".LineID" for (a, b) in cells])
+    return dict(zip(cells, vals))
 
-def _find_valid_a_indices(device, max_a=50, miss_limit=3, probe_b_range=5):
-    """Scan FLD[a,b].LineID to find active 'a' rows with early stop on consecutive misses."""
+def _valid_as_from_grid(grid, max_a=50, miss_limit=3, probe_b_range=5):
+    """Active 'a' rows of the LineID grid, with early stop on consecutive misses."""
     valid_as = []
     consec_miss = 0
     for a in range(max_a):
         any_here = False
         for b in range(probe_b_range):
-            p = "ns=1;s=[%s]FLD[%d,%d].LineID" % (device, a, b)
-            if _read_safe(p) is not None:
+            if grid.get((a, b)) is not None:
                 any_here = True
                 break
         if any_here:
@@ -59,42 +122,46 @@ def _find_valid_a_indices(device, max_a=50, miss_limit=3, probe_b_range=5):
                 break
     return valid_as
 
-def _collect_scan_indices(device, valid_as, probe_b_range=5):
-    """Collect all (a,b) that have a non-null LineID. (Loop form—no heavy comprehension.)"""
+def _indices_from_grid(grid, valid_as, probe_b_range=5):
+    """All (a,b) in the valid rows that have a non-null LineID."""
     indices = []
     for a in valid_as:
         for b in range(probe_b_range):
-            p = "ns=1;s=[%s]FLD[%d,%d].LineID" % (device, a, b)
-            if _read_safe(p) is not None:
+            if grid.get((a, b)) is not None:
                 indices.append((a, b))
     return indices
 
-def _group_active_by_a(device, scan_indices):
+def _groups_from_grid(grid, device, scan_indices, max_a=50):
     """
     Group active FLD roots by 'a' where LineID != 0.
-    Returns {a: [(root_path, (a,b)), ...]} and a flag if any non-zero was found.
+    Returns groups[a] = [(root_path, (a,b)), ...] (empty list = no active root) and a flag
+    if any non-zero was found.
     """
-    groups = {}
+    groups = [[] for _ in range(max_a)]
     found_non_zero = False
+    prefix = _fld_prefix(device)
     for (a, b) in scan_indices:
-        root = "ns=1;s=[%s]FLD[%d,%d]" % (device, a, b)
-        lid = _read_safe(root + ".LineID")
+        lid = grid.get((a, b))
         if lid and _safe_str(lid) != u"0":
             found_non_zero = True
-            groups.setdefault(a, []).append((root, (a, b)))
+            groups[a].append((_fld_root(prefix, a, b), (a, b)))
     return groups, found_non_zero
 
 def _resolve_station_hierarchy(station_name):
     """
     Returns (AREA, SUBAREA, LINE, STATION) using your Named Query.
-    Never throws; logs warn on failure.
+    Never throws; logs warn on failure. Successful lookups are cached per scan.
     """
+    hit = _HIER_CACHE.get(station_name)
+    if hit is not None:
+        return hit
+
     AREA = SUBAREA = LINE = u"Unknown"
     STATION = station_name
 
     try:
         ds = system.db.runNamedQuery(
-            "MagnaDataOps/Configuration/PlantConfiguration/HierarchyConfiguration/Additional/getSelectedStationHierarchy",
+            _HIER_NQ_BASE + "getSelectedStationHierarchy",
             {"station_name": station_name}
         )
         if ds and ds.getRowCount() > 0:
@@ -103,6 +170,7 @@ def _resolve_station_hierarchy(station_name):
             SUBAREA = row["subarea_name_clean"]
             LINE    = row["line_name_clean"]
             STATION = row["station_name_clean"]
+            _HIER_CACHE[station_name] = (AREA, SUBAREA, LINE, STATION)
     except Exception as e:
         # Avoid swallow; preserve behavior by continuing with "Unknown",
         # but leave a trace for diagnostics.
@@ -110,6 +178,31 @@ def _resolve_station_hierarchy(station_name):
                  "Hierarchy lookup failed for '%s': %s" % (_safe_str(station_name), _safe_str(e)))
     return AREA, SUBAREA, LINE, STATION
 
+def _prefetch_station_hierarchy(station_names):
+    """
+    One Named Query for many station names; fills _HIER_CACHE so the per-station
+    _resolve_station_hierarchy calls become dict hits. Names the query does not return
+    are left to the single-station lookup. Never throws.
+    """
+    names = [n for n in set(station_names) if n and n not in _HIER_CACHE]
+    if not names:
+        return
+    try:
+        ds = system.db.runNamedQuery(
+            _HIER_NQ_BASE + "getStationHierarchyByNames",
+            {"station_names_csv": ",".join(_safe_str(n) for n in names)}
+        )
+        for row in system.dataset.toPyDataSet(ds) if ds else []:
+            _HIER_CACHE[_safe_str(row["station_name"])] = (
+                row["area_name_clean"], row["subarea_name_clean"],
+                row["line_name_clean"], row["station_name_clean"]
+            )
+    except Exception as e:
+        log_warn("plantConfiguration::scanStationMetadata.prefetchHierarchy", "NA",
+                 "Batched hierarchy lookup failed; resolving per station: %s" % _safe_str(e))
+
+_ROOT_READS = 7   # per FLD root in _calc_station_stats: IsTurnTableStation, SideID, Fixtures[0..4]
+
 def _calc_station_stats(active_roots):
     """
     Detect if turntable, extract sideIDs and fixture counts.
@@ -117,10 +210,20 @@ def _calc_station_stats(active_roots):
     - If not TT → treat as standard with fx = len(active_roots)
     - If TT but total fixtures == 0 → convert to standalone (like original)
     """
+    # One read per station: IsTurnTableStation, SideID and the 5 fixture serials (probe capped
+    # at 5 as in original) for every root; the SideID/fixture values are only used for TT
+    paths = []
+    for (fld, _) in active_roots:
+        paths.append(fld + ".IsTurnTableStation")
+        paths.append(fld + ".SideID")
+        for i in range(5):
+            paths.append(fld + ".Fixtures[%d].Serial_Number_1" % i)
+    vals = _read_many(paths)
+
     # Turntable detection
     is_tt = False
-    for (fld, _) in active_roots:
-        if _boolish(_read_safe(fld + ".IsTurnTableStation")):
+    for k in range(len(active_roots)):
+        if _boolish(vals[k * _ROOT_READS]):
             is_tt = True
             break
 
@@ -134,15 +237,15 @@ def _calc_station_stats(active_roots):
         notes.append("std fx=%d" % len(active_roots))
         return is_tt, side_ids, tt_flags, fx_counts, notes
 
-    # is turntable → per root side & fixture scan
-    for (fld, (xx, yy)) in active_roots:
-        side = _read_safe(fld + ".SideID")
+    # is turntable → per root side & fixture count
+    for k, (fld, (xx, yy)) in enumerate(active_roots):
+        base = k * _ROOT_READS
+        side = vals[base + 1]
         side = _safe_str(side) if side else "0"
 
+        # fixtures count up to the first missing serial, as before
         fx = 0
-        # cap probe to 5 as in original
-        for i in range(5):
-            sn = _read_safe(fld + ".Fixtures[%d].Serial_Number_1" % i)
+        for sn in vals[base + 2:base + _ROOT_READS]:
             if sn is not None:
                 fx += 1
             else:
@@ -151,9 +254,13 @@ def _calc_station_stats(active_roots):
         side_ids.append(side)
         tt_flags.append("True")
         fx_counts.append(str(fx))
-        notes.append("FLD[%d,%d]:side=%s fx=%d" % (xx, yy, side, fx))
+        if _STATUS_VERBOSE:
+            notes.append("FLD[%d,%d]:side=%s fx=%d" % (xx, yy, side, fx))
         total_fx += fx
 
+    if not _STATUS_VERBOSE:
+        notes = ["TT roots=%d fx=%d" % (len(active_roots), total_fx)]
+
     if total_fx == 0:
         # Convert to standalone exactly like the original
         side_ids = ["0"]
@@ -163,6 +270,13 @@ def _calc_station_stats(active_roots):
 
     return is_tt, side_ids, tt_flags, fx_counts, notes
 
+# UDT typeIds by (capped) fixture count(s); fixtures per side are capped to 3
+_FX_CAP = 3
+_TYPEID_FLAT = dict((n, "StationUDT/Station_Flat_%d" % n) for n in range(_FX_CAP + 1))
+_TYPEID_TT1  = dict((n, "StationUDT/Station_TT_1_%d" % n) for n in range(_FX_CAP + 1))
+_TYPEID_TT2  = dict(((a, b), "StationUDT/Station_TT_2_%d_%d" % (a, b))
+                    for a in range(_FX_CAP + 1) for b in range(_FX_CAP + 1))
+
 def _determine_type_id(is_turntable, fx_counts_csv):
     """
     Compute UDT typeId using the same branching logic as original.
@@ -172,29 +286,139 @@ def _determine_type_id(is_turntable, fx_counts_csv):
     for x in (fx_counts_csv or "").split(","):
         x = x.strip()
         if x.isdigit():
-            fx_list.append(int(x))
+            fx_list.append(min(int(x), _FX_CAP))
     side_cnt = len(fx_list)
 
     if not is_turntable:
-        fx_count = min(sum(fx_list), 3)
-        return "StationUDT/Station_Flat_%d" % fx_count, side_cnt
+        return _TYPEID_FLAT[min(sum(fx_list), _FX_CAP)], side_cnt
 
     if side_cnt == 1:
-        fx = min(fx_list[0], 3)
-        return "StationUDT/Station_TT_1_%d" % fx, side_cnt
+        return _TYPEID_TT1[fx_list[0]], side_cnt
     if side_cnt == 2:
-        fx1, fx2 = min(fx_list[0], 3), min(fx_list[1], 3)
-        return "StationUDT/Station_TT_2_%d_%d" % (fx1, fx2), side_cnt
+        return _TYPEID_TT2[(fx_list[0], fx_list[1])], side_cnt
 
     return None, side_cnt  # invalid side count
 
 
 # ───── Function: scanStationMetadata ─────────────────────────────────────
-def scanStationMetadata(deviceList, user_id):
+_UNKNOWN_HIER = ["Unknown", "Unknown", "Unknown"]
+
+def _error_row(device, status):
+    """StationMetaData row for a device that produced no stations."""
+    return _UNKNOWN_HIER + [device, "", "", "", status, device, "0"]
+
+def _probe_device(device):
+    """
+    OPC part of one device scan (no Named Queries, safe on a worker thread).
+    Returns (error_rows, stations); stations = [(a, stationID, stationName, stats), ...].
     """
-    Scans each device's FLD[a,b] nodes via OPC UA.
+    # LineID grid read once per device; presence, indices and groups all derive from it
+    grid = _scan_lineid_grid(device)
+
+    # quick probe: must have at least FLD[0,0].LineID
+    if grid.get((0, 0)) is None:
+        return [_error_row(device, "ERROR: primary missing")], []
+
+    valid_as = _valid_as_from_grid(grid)
+    scan_indices = _indices_from_grid(grid, valid_as)
+    if not scan_indices:
+        return [_error_row(device, "ERROR: no FLD[*] found")], []
+
+    groups, found_non_zero = _groups_from_grid(grid, device, scan_indices)
+    if not found_non_zero:
+        return [_error_row(device, "ERROR: all LineID=0")], []
+
+    n_groups = sum(1 for active in groups if active)
+
+    # station names (StationID preferred) and stats for every active row
+    stations = []
+    subCount = 0
+    for a, active in enumerate(groups):
+        if not active:
+            continue
+        subCount += 1
+
+        # Prefer StationID from any active root
+        stationID = None
+        for val in _read_many([fld + ".StationID" for (fld, _) in active]):
+            if val and _safe_str(val).strip():
+                stationID = _safe_str(val).strip()
+                break
+
+        # Fallback naming logic mirrors original
+        stationName = stationID or (device if n_groups == 1 else (device + "_" + _safe_str(subCount)))
+        stations.append((a, stationID, stationName, _calc_station_stats(active)))
+    return [], stations
+
+def _device_rows(device, stations):
+    """StationMetaData rows for one probed device; resolves hierarchy (Named Query, calling thread)."""
+    rows = []
+    for (a, stationID, stationName, stats) in stations:
+        stationIDX = _safe_str(a)
+
+        # Resolve hierarchy; keep Unknowns on failure
+        AREA, SUBAREA, LINE, stationName = _resolve_station_hierarchy(stationName) if stationID else ("Unknown", "Unknown", "Unknown", stationName)
+
+        is_tt, side_ids, tt_flags, fx_counts, notes = stats
+        status = "OK: " + "; ".join(notes)
+
+        rows.append([
+            AREA, SUBAREA, LINE, stationName,
+            ",".join(side_ids),
+            ",".join(tt_flags),
+            ",".join(fx_counts),
+            status, device, stationIDX
+        ])
+    return rows
+
+def _scan_devices(deviceList):
+    """
+    Probe devices concurrently (at most _SCAN_WORKERS in flight, to go easy on the OPC server).
+    Workers are system.util.invokeAsynchronous threads and only do OPC reads; the hierarchy
+    Named Queries (one prefetch for all devices) run afterwards on the calling thread.
+    Rows come back in deviceList order; a failing device re-raises here.
+    """
+    n = len(deviceList)
+    probed = [None] * n   # i -> ((error_rows, stations), exception)
+    if n == 1:
+        probed[0] = (_probe_device(deviceList[0]), None)
+    else:
+        pending = ConcurrentLinkedQueue(range(n))
+
+        def _worker():
+            while True:
+                i = pending.poll()
+                if i is None:
+                    return
+                try:
+                    probed[i] = (_probe_device(deviceList[i]), None)
+                except Exception as e:
+                    probed[i] = (None, e)
+
+        threads = [system.util.invokeAsynchronous(_worker) for _ in range(min(_SCAN_WORKERS, n))]
+        for t in threads:
+            t.join()
+
+    for (_res, err) in probed:
+        if err is not None:
+            raise err
+
+    # one hierarchy query for all named stations across the scanned devices
+    _prefetch_station_hierarchy([sid_ for ((_e, sts_), _x) in probed
+                                 for (_a, sid_, _n, _s) in sts_ if sid_])
+
+    rows = []
+    for device, ((error_rows, stations), _x) in zip(deviceList, probed):
+        rows.extend(error_rows or _device_rows(device, stations))
+    return rows
+
+def scanStationMetadata(deviceList, user_id, return_ds=False):
+    """
+    Scans each device's FLD[a,b] nodes via OPC UA (devices in parallel).
     Resolves hierarchy using station name via Named Query.
     Writes final dataset to configured memory tag.
+    With return_ds=True returns (rc, ds) so the caller can hand ds straight to
+    createStationUDTs; ds is None unless rows were written.
     Return codes preserved from original:
       903 = wrote rows, good
       904 = nothing created (kept for symmetry)
@@ -202,82 +426,84 @@ def scanStationMetadata(deviceList, user_id):
       901 = warning / no input or no data
       905 = error
     """
+    rc, ds = _scan_station_metadata(deviceList, user_id)
+    return (rc, ds) if return_ds else rc
+
+def _scan_station_metadata(deviceList, user_id):
     try:
         if not deviceList:
             log_warn("plantConfiguration::scanStationMetadata", user_id, "No device list provided.")
-            return 901
-
-        rows = []
+            return 901, None
 
-        for device in deviceList:
-            # quick probe: must have at least FLD[0,0].LineID
-            if _read_safe("ns=1;s=[%s]FLD[0,0].LineID" % device) is None:
-                rows.append(["Unknown", "Unknown", "Unknown", device, "", "", "", "ERROR: primary missing", device, "0"])
-                continue
-
-            valid_as = _find_valid_a_indices(device)
-            scan_indices = _collect_scan_indices(device, valid_as)
-            if not scan_indices:
-                rows.append(["Unknown", "Unknown", "Unknown", device, "", "", "", "ERROR: no FLD[*] found", device, "0"])
-                continue
-
-            groups, found_non_zero = _group_active_by_a(device, scan_indices)
-            if not found_non_zero:
-                rows.append(["Unknown", "Unknown", "Unknown", device, "", "", "", "ERROR: all LineID=0", device, "0"])
-                continue
-
-            subCount = 0
-            for a in sorted(groups):
-                active = groups[a]
-                subCount += 1
-                stationIDX = _safe_str(a)
-
-                # Prefer StationID from any active root
-                stationID = None
-                for (fld, _) in active:
-                    val = _read_safe(fld + ".StationID")
-                    if val and _safe_str(val).strip():
-                        stationID = _safe_str(val).strip()
-                        break
-
-                # Fallback naming logic mirrors original
-                stationName = stationID or (device if len(groups) == 1 else (device + "_" + _safe_str(subCount)))
-
-                # Resolve hierarchy; keep Unknowns on failure
-                AREA, SUBAREA, LINE, stationName = _resolve_station_hierarchy(stationName) if stationID else ("Unknown", "Unknown", "Unknown", stationName)
-
-                # Calculate station stats
-                is_tt, side_ids, tt_flags, fx_counts, notes = _calc_station_stats(active)
-                status = "OK: " + "; ".join(notes)
-
-                rows.append([
-                    AREA, SUBAREA, LINE, stationName,
-                    ",".join(side_ids),
-                    ",".join(tt_flags),
-                    ",".join(fx_counts),
-                    status, device, stationIDX
-                ])
+        _HIER_CACHE.clear()
+        if not _check_connection():
+            log_warn("plantConfiguration::scanStationMetadata", user_id,
+                     "OPC server '%s' is not connected; devices will report primary missing." % _CONN)
+        rows = _scan_devices(list(deviceList))
 
         if rows:
             ds = toDataSet(_HEADERS, rows)
             system.tag.writeBlocking([_OUTTAG], [ds])
             log_info("plantConfiguration::scanStationMetadata", user_id,
                      "✅ %d rows written to %s" % (len(rows), _OUTTAG))
-            return 903
+            return 903, ds
 
         log_warn("plantConfiguration::scanStationMetadata", user_id, "No station data collected")
-        return 901
+        return 901, None
 
     except Exception:
         # Our project logger logs stack trace via exc_info internally
         log_error("plantConfiguration::scanStationMetadata", user_id)
-        return 905
+        return 905, None
 
 
 # ───── Function: createStationUDTs ───────────────────────────────────────
-def createStationUDTs(user_id):
+def _or_unknown(raw):
+    """Normalize any-case "unknown" to "Unknown"; other values pass through untouched."""
+    if isinstance(raw, basestring):
+        return "Unknown" if raw.lower() == "unknown" else raw
+    return "Unknown" if _safe_str(raw).lower() == "unknown" else raw
+
+def _folder(name, tags):
+    return {"name": name, "tagType": "Folder", "tags": tags}
+
+def _merged_folder_trees(tree, unknown_tags):
+    """
+    {area: {subArea: {line: [tagTree]}}} + Unknown-folder tags → the folder-tree list for
+    system.tag.configure, with each area/subarea/line folder appearing once.
+    """
+    trees = [
+        _folder(area, [
+            _folder(subArea, [_folder(line, tags) for line, tags in lines.items()])
+            for subArea, lines in subAreas.items()
+        ])
+        for area, subAreas in tree.items()
+    ]
+    if unknown_tags:
+        trees.append(_folder("Unknown", unknown_tags))
+    return trees
+
+def _tag_key(path):
+    """Case-insensitive tag path key; treats "[prov]/a" and "[prov]a" alike."""
+    return _safe_str(path).replace("]/", "]").lower()
+
+def _existing_udt_paths(basePath):
+    """
+    One recursive browse for every UDT instance under basePath.
+    Returns a set of _tag_key paths, or None if the browse fails (caller falls back to exists()).
+    """
+    try:
+        results = system.tag.browse(basePath, {"recursive": True, "tagType": "UdtInstance"}).getResults()
+        return set(_tag_key(r["fullPath"]) for r in results)
+    except Exception as e:
+        log_warn("plantConfiguration::StationUDTCreate", "NA",
+                 "Tag browse failed; checking paths one by one: %s" % _safe_str(e))
+        return None
+
+def createStationUDTs(user_id, ds=None):
     """
     Creates Station UDT instances from StationMetaData dataset.
+    Pass ds (e.g. from scanStationMetadata(..., return_ds=True)) to skip re-reading the tag.
     Preserves original behavior and return codes.
     """
     basePath     = "[MagnaDataOps]/MagnaStations"
@@ -285,27 +511,38 @@ def createStationUDTs(user_id):
     dataTagPath  = _OUTTAG
 
     try:
-        ds = system.tag.readBlocking([dataTagPath])[0].value
+        if ds is None:
+            ds = system.tag.readBlocking([dataTagPath])[0].value
         if ds is None or ds.rowCount == 0:
             log_warn("plantConfiguration::StationUDTCreate", user_id, "No station metadata to process.")
             return 901
 
         total, skipped, created = ds.rowCount, 0, 0
 
+        # resolve column indices once instead of per-row name lookups
+        IDX = dict((name, ds.getColumnIndex(name)) for name in _HEADERS)
+
+        # existence is checked against one up-front browse; folder trees are configured in one call
+        existing = _existing_udt_paths(basePath)
+        tree = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))   # area → subArea → line → [tagTree]
+        unknown_tags = []
+        queued = set()   # paths already queued earlier in this run
+        new_by_top = defaultdict(list)   # top-level folder (area or "Unknown") → [(station, typeId)] not yet present
+
         for row in range(total):
-            areaRaw     = ds.getValueAt(row, "Area")
-            subAreaRaw  = ds.getValueAt(row, "SubArea")
-            lineRaw     = ds.getValueAt(row, "Line")
-            station     = ds.getValueAt(row, "Station")
-            sideIDs     = ds.getValueAt(row, "SideIDs") or ""
-            isTT        = ds.getValueAt(row, "IsTurntable") or ""
-            fxCounts    = ds.getValueAt(row, "FixtureCounts") or ""
-            device      = ds.getValueAt(row, "Device")
-            stationIdx  = ds.getValueAt(row, "StationIDX")
-
-            area    = areaRaw    if _safe_str(areaRaw).lower()    != "unknown" else "Unknown"
-            subArea = subAreaRaw if _safe_str(subAreaRaw).lower() != "unknown" else "Unknown"
-            line    = lineRaw    if _safe_str(lineRaw).lower()    != "unknown" else "Unknown"
+            areaRaw     = ds.getValueAt(row, IDX["Area"])
+            subAreaRaw  = ds.getValueAt(row, IDX["SubArea"])
+            lineRaw     = ds.getValueAt(row, IDX["Line"])
+            station     = ds.getValueAt(row, IDX["Station"])
+            sideIDs     = ds.getValueAt(row, IDX["SideIDs"]) or ""
+            isTT        = ds.getValueAt(row, IDX["IsTurntable"]) or ""
+            fxCounts    = ds.getValueAt(row, IDX["FixtureCounts"]) or ""
+            device      = ds.getValueAt(row, IDX["Device"])
+            stationIdx  = ds.getValueAt(row, IDX["StationIDX"])
+
+            area    = _or_unknown(areaRaw)
+            subArea = _or_unknown(subAreaRaw)
+            line    = _or_unknown(lineRaw)
 
             stationFolderPath = "[%s]" % device
             if area == "Unknown":
@@ -313,7 +550,13 @@ def createStationUDTs(user_id):
             else:
                 tagPath = "%s/%s/%s/%s/%s" % (basePath, area, subArea, line, station)
 
-            tagExists = system.tag.exists(tagPath)
+            key = _tag_key(tagPath)
+            if key in queued:
+                tagExists = True
+            elif existing is None:
+                tagExists = system.tag.exists(tagPath)
+            else:
+                tagExists = key in existing
 
             is_turntable = ("true" in _safe_str(isTT).lower())
             typeId, side_cnt = _determine_type_id(is_turntable, fxCounts)
@@ -335,27 +578,35 @@ def createStationUDTs(user_id):
                 }
             }
 
-            # Build folders exactly as before
+            # Same folder layout as before, merged across rows (Unknown/<station> or area/subArea/line/<station>)
             if area == "Unknown":
-                folderTree = {"name": "Unknown", "tagType": "Folder", "tags": [tagTree]}
+                unknown_tags.append(tagTree)
             else:
-                folderTree = {
-                    "name": area, "tagType": "Folder", "tags": [{
-                        "name": subArea, "tagType": "Folder", "tags": [{
-                            "name": line, "tagType": "Folder", "tags": [tagTree]
-                        }]
-                    }]
-                }
-
-            system.tag.configure(basePath=basePath, tags=[folderTree], collisionPolicy="m")
+                tree[area][subArea][line].append(tagTree)
+            queued.add(key)
 
             if not tagExists:
-                log_info("plantConfiguration::createStationUDTs", user_id,
-                         "Created UDT: %s (%s)" % (station, typeId))
-                created += 1
+                new_by_top[area].append((station, typeId))
             else:
                 skipped += 1
 
+        folder_trees = _merged_folder_trees(tree, unknown_tags)
+        if folder_trees:
+            # one QualityCode per top-level folder; only count stations whose folder configured good
+            qcs = system.tag.configure(basePath=basePath, tags=folder_trees, collisionPolicy="m")
+            for ft, qc in zip(folder_trees, qcs):
+                new_tags = new_by_top.get(ft["name"], [])
+                if not qc.isGood():
+                    log_warn("plantConfiguration::StationUDTCreate", user_id,
+                             "Configure failed for folder %s (%s); %d station(s) not created." %
+                             (_safe_str(ft["name"]), _safe_str(qc), len(new_tags)))
+                    skipped += len(new_tags)
+                    continue
+                for (station, typeId) in new_tags:
+                    log_info("plantConfiguration::createStationUDTs", user_id,
+                             "Created UDT: %s (%s)" % (station, typeId))
+                    created += 1
+
         log_info("plantConfiguration::createStationUDTs", user_id,
                  "UDT creation summary: %d created, %d skipped, out of %d" % (created, skipped, total))
 
@@ -6,7 +6,11 @@
 # </summary>
 
 import system
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from threading import RLock
 from traceback import format_exc
+from java.lang import System as _JSystem
 from MagnaDataOps.LoggerFunctions import log_info as _log_info, log_warn as _log_warn, log_error as _log_error
 
 # -------- local logging helper (consistent with CommonScripts) --------
@@ -29,12 +33,26 @@ _NQ_BASE = "MagnaDataOps/Dashboard/AllProductionData/DataPublish/"
 _DEFAULT_SERVER_NAME = "Local Broker"
 _BROKER_TAG_PATH     = "[MagnaDataOps]BrokerName"
 _BROKER_TTL_SEC      = 60.0
+
+# Publish grouping: False = one message per row (current consumers);
+# True = one {"batch-format":"v1","batch-size":N,"batch":[...]} message per (topic, qos, retain)
+_BATCH_PUBLISH       = False
+_MAX_BATCH_SIZE      = 50
 _ISO_FMT             = "yyyy-MM-dd'T'HH:mm:ss.SSSXXX"
 
+# Fixed-schema payloads, pre-encoded (skips the dict -> jsonEncode trip on the hot paths).
+# String fields are ASCII dates/hours; Version goes through _json_str once per batch.
+_HOURLY_TMPL = (u'{"Version":"%s","Timestamp":"%s","HourlyProduction":{"ProductionDate":"%s",'
+                u'"ProductionHour":"%s","Actual":%d,"HourlyTarget":%d,"LiveTarget":%d,"BucketID":%d}}')
+_SHIFT_TMPL  = (u'{"Version":"%s","Timestamp":"%s","ShiftProduction":{"ProductionDate":"%s",'
+                u'"Actual":%d,"ProductionTarget":%d,"LiveTarget":%d,"BucketID":%d}}')
+_BATCH_TMPL  = u'{"batch-format":"v1","batch-size":%d,"batch":[%s]}'
+
 # Windows
 _HOURLY_PUBLISH_LOOKBACK_HRS = 6     # current/open hours window
 _HOURLY_CATCHUP_CLOSED_HRS   = 48    # closed+unpublished catch-up window
 _BREAKS_REFRESH_SEC          = 120
+_BREAKS_EMPTY_TTL_SEC        = 30*60  # re-query a day with no breaks only this often
 
 # Named Queries under _NQ_BASE
 _NQ_HIER                  = "getHierarchyForStations"
@@ -44,13 +62,24 @@ _NQ_GET_WEEKLY_TO_PUBLISH = "getWeeklyRowsToPublish"
 _NQ_MARK_HOURLY_PUBLISHED = "markHourlyPublished"
 _NQ_MARK_SHIFT_PUBLISHED  = "markShiftPublished"
 _NQ_MARK_WEEKLY_PUBLISHED = "markWeeklyPublished"
+_NQ_MARK_HOURLY_PUBLISHED_BATCH = "markHourlyPublishedBatch"   # payload = JSON array of the single-row params
+_NQ_MARK_SHIFT_PUBLISHED_BATCH  = "markShiftPublishedBatch"
+_NQ_MARK_WEEKLY_PUBLISHED_BATCH = "markWeeklyPublishedBatch"
 _NQ_GET_BREAKS            = "getBreaksOnDate" 
+_BATCH_NQ_RETRY_SEC       = 60.0   # after a batch mark NQ fails, use the single-row NQs this long
 
 # -------- Small caches --------
 _hier         = {}     # sid -> names/ids
+_NO_HIER      = {}     # shared miss value for _hier lookups (never mutated)
 _hier_loaded  = set()
-_broker_cache = {"t":0.0, "v":_DEFAULT_SERVER_NAME}
-_breaks       = {"last_load": 0, "today": None, "yday": None, "by_line": {}}
+_cache_lock   = RLock()   # hierarchy/breaks refresh; scopes publish concurrently in publish_pending
+_topic_cache  = {}     # sid -> {scope_slug: topic}; dropped when the sid's hierarchy is (re)loaded
+_broker_cache = {"t":None, "v":_DEFAULT_SERVER_NAME}   # t = _now_s() of last lookup
+_breaks       = {"last_load": 0, "today": None, "yday": None, "by_line": {},
+                 "empty_until": {}}   # day -> ms until which an empty result is trusted
+_hour_fmt_cache     = OrderedDict()   # hour_ms -> (prod_date, prod_hour, bucket_local); FIFO
+_HOUR_FMT_CACHE_MAX = 256             # ~11 days of hours
+_batch_nq_off = {}     # batch NQ name -> _now_s() until which it is skipped
 
 # -------- Utils --------
 def _u(x):
@@ -68,6 +97,11 @@ def _get_version():
         _log_exc("_get_version")
         return u"1.0.0"
 
+def _json_str(s):
+    """Escape a value for use inside a JSON string literal in the payload templates."""
+    s = _u(s).replace(u"\\", u"\\\\").replace(u'"', u'\\"')
+    return u"".join([c if c >= u" " else u"\\u%04x" % ord(c) for c in s])
+
 def _nq(name, params=None):
     try:
         return system.db.runNamedQuery(_NQ_BASE + name, params or {})
@@ -93,6 +127,13 @@ def _rowdicts(ds):
             return ds
     except Exception:
         pass
+    # fast path: one PyDataSet conversion, rows zipped against the column names
+    try:
+        pds=system.dataset.toPyDataSet(ds)
+        cols=list(pds.getColumnNames())
+        return [dict(zip(cols, row)) for row in pds]
+    except Exception:
+        _log_exc("_rowdicts:pydataset")
     out=[]
     try:
         cols=list(ds.getColumnNames())
@@ -136,19 +177,19 @@ def _hour_bucket_local(d):
         _log_exc("_hour_bucket_local")
         return 0
 
-def _as_int_bool(v):
-    try:
-        # handles 1/0, True/False, java.lang.Boolean
-        return 1 if (v is True or int(v)==1) else 0
-    except Exception:
-        return 0
+def _hour_fmt(hloc, hour_ms):
+    """(prod_date, prod_hour, bucket_local) for an hour start, formatted once per distinct hour."""
+    v = _hour_fmt_cache.get(hour_ms)
+    if v is None:
+        v = (_fmt_date_local(hloc) + "T00:00:00", _fmt_hour_HH(hloc), _hour_bucket_local(hloc))
+        if len(_hour_fmt_cache) >= _HOUR_FMT_CACHE_MAX:
+            _hour_fmt_cache.popitem(last=False)
+        _hour_fmt_cache[hour_ms] = v
+    return v
 
 def _now_s():
-    try:
-        from time import time; return time()
-    except Exception:
-        _log_exc("_now_s")
-        return 0.0
+    # monotonic seconds (JVM nanoTime); only for TTL deltas, unaffected by wall-clock jumps
+    return _JSystem.nanoTime() / 1e9
 
 def _datestr(d): 
     try:
@@ -158,6 +199,11 @@ def _datestr(d):
         return "1970-01-01"
 
 def _load_breaks_if_needed():
+    # one refresher at a time; concurrent scope publishers wait and then see the fresh spans
+    with _cache_lock:
+        _load_breaks_locked()
+
+def _load_breaks_locked():
     now = system.date.now()
     now_ms = system.date.toMillis(now)
     today = _datestr(now)
@@ -168,40 +214,51 @@ def _load_breaks_if_needed():
         return
 
     by_line = {}
+    empty_until = dict((d, t) for d, t in _breaks["empty_until"].items() if d in (yday, today))
     for day in (yday, today):
+        if now_ms < empty_until.get(day, 0):
+            continue
         try:
             ds = _nq(_NQ_GET_BREAKS, {"shift_date": day})
         except Exception:
             _log_exc("_load_breaks_if_needed:query")
             ds = []
-        for r in _rowdicts(ds):
-            try:
-                if not int(r.get("is_active") or 0):  # skip inactive
-                    continue
-                lid = int(r["line_id"])
-                bstart = r["break_start_time"]; bend = r["break_end_time"]
-                if not bstart or not bend: 
-                    continue
-                s = system.date.toMillis(bstart); e = system.date.toMillis(bend)
-                if e <= s: 
-                    continue
+        rows = _rowdicts(ds)
+        # negative-cache only a real empty result (_nq returns [] on error)
+        if not rows and not isinstance(ds, list):
+            empty_until[day] = now_ms + _BREAKS_EMPTY_TTL_SEC*1000
+        else:
+            empty_until.pop(day, None)
+        try:
+            to_ms = system.date.toMillis
+            spans = [(int(r["line_id"]), to_ms(r["break_start_time"]), to_ms(r["break_end_time"]))
+                     for r in rows
+                     if int(r.get("is_active") or 0) and r.get("line_id") is not None
+                        and r.get("break_start_time") and r.get("break_end_time")]
+        except Exception:
+            _log_exc("_load_breaks_if_needed:rows")
+            continue
+        for lid, s, e in spans:
+            if e > s:
                 by_line.setdefault(lid, []).append((s, e))
-            except Exception:
-                _log_exc("_load_breaks_if_needed:row")
-                continue
 
-    # merge overlaps
+    # merge overlaps; store as parallel (starts, ends, cum) lists
+    # cum[i] = total break ms in spans[:i]
     for lid, spans in by_line.items():
         spans.sort()
-        merged = []
+        starts = []; ends = []
         for s, e in spans:
-            if not merged or s > merged[-1][1]:
-                merged.append([s, e])
-            else:
-                merged[-1][1] = max(merged[-1][1], e)
-        by_line[lid] = [(a, b) for (a, b) in merged]
+            if not ends or s > ends[-1]:
+                starts.append(s); ends.append(e)
+            elif e > ends[-1]:
+                ends[-1] = e
+        cum = [0]
+        for s, e in zip(starts, ends):
+            cum.append(cum[-1] + (e - s))
+        by_line[lid] = (starts, ends, cum)
 
     _breaks["by_line"]  = by_line
+    _breaks["empty_until"] = empty_until
     _breaks["last_load"] = now_ms
     _breaks["today"]     = today
     _breaks["yday"]      = yday
@@ -210,19 +267,24 @@ def _working_ms(start_ms, end_ms, line_id):
     total = max(0, end_ms - start_ms)
     if total == 0: 
         return 0
-    spans = _breaks["by_line"].get(int(line_id), [])
+    spans = _breaks["by_line"].get(int(line_id))
     if not spans: 
         return total
-    blocked = 0
-    for s, e in spans:
-        lo = max(start_ms, s); hi = min(end_ms, e)
-        if hi > lo: 
-            blocked += (hi - lo)
+    blocked = _break_ms_before(spans, end_ms) - _break_ms_before(spans, start_ms)
     return max(0, total - blocked)
+
+def _break_ms_before(spans, t):
+    """Break ms on the line before t: prefix sum of whole spans + the part of any span containing t."""
+    starts, ends, cum = spans
+    i = bisect_right(ends, t)
+    if i < len(starts) and starts[i] < t:
+        return cum[i] + (t - starts[i])
+    return cum[i]
     
 def _get_broker_name():
     now=_now_s()
-    if (now-(_broker_cache.get("t") or 0.0))<_BROKER_TTL_SEC and _broker_cache.get("v"):
+    t=_broker_cache.get("t")
+    if t is not None and (now-t)<_BROKER_TTL_SEC and _broker_cache.get("v"):
         return _broker_cache["v"]
     try:
         res = system.tag.readBlocking([_BROKER_TAG_PATH])[0]
@@ -248,16 +310,65 @@ def _get_broker_name():
 def _publish(topic,obj,qos=0,retain=False,server_name=None):
     try:
         server=server_name or _get_broker_name()
-        payload=system.util.jsonEncode(obj).encode("utf-8")
+        if isinstance(obj, basestring):
+            payload=obj.encode("utf-8")   # pre-encoded JSON
+        else:
+            payload=system.util.jsonEncode(obj).encode("utf-8")
         system.cirruslink.engine.publish(server,topic,payload,int(qos),bool(retain))
     except Exception:
         _log_exc("_publish")
         pass
 
+def _publish_groups(groups, server_name=None):
+    """
+    Flush {(topic, qos, retain): [payload, ...]} collected by a publish_*_rows call.
+    Broker resolved once; groups are split into batches of at most _MAX_BATCH_SIZE.
+    """
+    if not groups:
+        return
+    server = server_name or _get_broker_name()
+    for (topic, qos, retain), payloads in groups.items():
+        if not _BATCH_PUBLISH:
+            for p in payloads:
+                _publish(topic, p, qos, retain, server)
+            continue
+        for i in range(0, len(payloads), _MAX_BATCH_SIZE):
+            chunk = [p if isinstance(p, basestring) else system.util.jsonEncode(p)
+                     for p in payloads[i:i + _MAX_BATCH_SIZE]]
+            _publish(topic, _BATCH_TMPL % (len(chunk), u",".join(chunk)), qos, retain, server)
+
+def _mark_published(batch_nq, single_nq, marks, where):
+    """
+    Mark rows published in one round-trip (batch NQ takes the single-row param dicts as JSON).
+    Falls back to one single-row NQ call per mark if the batch NQ fails, and keeps
+    using the single-row NQs for _BATCH_NQ_RETRY_SEC (one warning per window).
+    """
+    if not marks:
+        return
+    now = _now_s()
+    off = _batch_nq_off.get(batch_nq)   # nanoTime origin is arbitrary: no 0 sentinel
+    if off is None or now >= off:
+        try:
+            system.db.runNamedQuery(_NQ_BASE + batch_nq, {"payload": system.util.jsonEncode(marks)})
+            return
+        except Exception as e:
+            _batch_nq_off[batch_nq] = now + _BATCH_NQ_RETRY_SEC
+            _log_warn("ProductionPublisher::%s:batch" % where,
+                      message="%s failed; single-row marks for %ds: %s" % (batch_nq, _BATCH_NQ_RETRY_SEC, e))
+    for m in marks:
+        _nq(single_nq, m)
+
 # -------- Hierarchy + topics --------
 def _load_hierarchy_for(station_ids):
-    need=[int(s) for s in station_ids if int(s) not in _hier_loaded]
-    if not need: 
+    sids=set([int(s) for s in station_ids])
+    if not (sids - _hier_loaded):
+        return
+    with _cache_lock:
+        _load_hierarchy_locked(sids)
+
+def _load_hierarchy_locked(sids):
+    need=list(sids - _hier_loaded)   # another scope may have loaded them while we waited
+    if not need:
         return
     try:
         ds=_nq(_NQ_HIER,{"station_ids_csv":_to_csv(need)})
@@ -274,6 +385,7 @@ def _load_hierarchy_for(station_ids):
                   "division_name": _u(d.get("division_name_clean") or d.get("division_name") or "")
                 }
                 _hier_loaded.add(sid)
+                _topic_cache.pop(sid, None)
             except Exception:
                 _log_exc("_load_hierarchy_for:row")
                 continue
@@ -285,7 +397,17 @@ def _san(s):
     return (s or u"").replace(" ", "")
 
 def _topic_for(sid, scope_slug):
-    h = _hier.get(int(sid), {})
+    sid = int(sid)
+    by_slug = _topic_cache.get(sid)
+    if by_slug is None:
+        by_slug = _topic_cache[sid] = {}
+    t = by_slug.get(scope_slug)
+    if t is None:
+        t = by_slug[scope_slug] = _build_topic(sid, scope_slug)
+    return t
+
+def _build_topic(sid, scope_slug):
+    h = _hier.get(sid, _NO_HIER)
     div   = _san(h.get("division_name") or "NA")
     plant = _san(h.get("plant_name")   or "Plant")
     area  = _san(h.get("area_name")    or "Area")
@@ -317,38 +439,57 @@ def _params_weekly_now():
     return {"now_local": system.date.now()}
 
 # -------- Per-scope publishers --------
-def publish_hourly_rows(rows, live_snap_unused=None, qos=0, retain=False):
-    rows = _rowdicts(rows)
+def publish_hourly_rows(rows, live_snap_unused=None, qos=0, retain=False, server_name=None):
+    rows = [r for r in _rowdicts(rows) if r.get("station_id") is not None]
     if not rows: 
         return 0
 
     _load_hierarchy_for([int(r["station_id"]) for r in rows])
     _load_breaks_if_needed()
 
-    ver    = _get_version()
+    # one line's rows back-to-back (same break spans / topics), hours in order per station
+    # total key: an unparseable row sorts first and is left to the per-row guard below
+    def _order(r):
+        try:
+            sid  = int(r["station_id"])
+            hloc = r.get("hour_local") or r.get("hour_start_utc")
+            return (int(r.get("line_id") or _hier.get(sid, _NO_HIER).get("line_id") or 0),
+                    sid, system.date.toMillis(hloc) if hloc else 0)
+        except Exception:
+            return (0, r.get("station_id"), 0)
+    rows = sorted(rows, key=_order)
+
+    ver_js = _json_str(_get_version())
+    ts     = _iso_now()      # one publish timestamp per batch
     sent   = 0
     now    = system.date.now()
     now_ms = system.date.toMillis(now)
+    out    = defaultdict(list)   # (topic, qos, retain) -> payloads, flushed after the loop
+    marks  = []
 
     for r in rows:
         try:
             sid   = int(r["station_id"])
-            lid   = int(r.get("line_id") or (_hier.get(sid, {}).get("line_id") or 0))
+            lid   = int(r.get("line_id") or _hier.get(sid, _NO_HIER).get("line_id") or 0)
             hloc  = r.get("hour_local") or r.get("hour_start_utc")
             if not hloc: 
                 continue
 
-            prod_date = _fmt_date_local(hloc) + "T00:00:00"
-            prod_hour = _fmt_hour_HH(hloc)
-            bucket_id = int(r.get("bucket_id") if r.get("bucket_id") is not None else _hour_bucket_local(hloc))
-
             actual    = int(r.get("total_parts") or 0)
             tgt_base  = int(r.get("target_parts_base") or 0)
-            is_closed = _as_int_bool(r.get("is_closed"))
-            is_pub    = _as_int_bool(r.get("is_published"))
+            # SQL bit/int flags arrive as int/long or bool; True == 1 covers both
+            is_closed = 1 if r.get("is_closed") == 1 else 0
+            is_pub    = 1 if r.get("is_published") == 1 else 0
+
+            # empty hour already closed out and published: nothing new to send
+            if actual == 0 and tgt_base == 0 and is_closed and is_pub:
+                continue
 
-            # --- break-aware LiveTarget ---
             hour_ms   = system.date.toMillis(hloc)
+            prod_date, prod_hour, bucket_local = _hour_fmt(hloc, hour_ms)
+            bucket_id = int(r.get("bucket_id") if r.get("bucket_id") is not None else bucket_local)
+
+            # --- break-aware LiveTarget ---
             hour_end  = hour_ms + 3600*1000
             if is_closed or tgt_base <= 0:
                 tgt_live = 0
@@ -364,55 +505,48 @@ def publish_hourly_rows(rows, live_snap_unused=None, qos=0, retain=False):
                     frac = min(1.0, max(0.0, float(work_elapsed_sec) / float(work_total_sec)))
                     tgt_live = int(tgt_base * frac)  # floor
 
-            payload = {
-              "Version":   ver,
-              "Timestamp": _iso_now(),
-              "HourlyProduction": {
-                "ProductionDate": prod_date,
-                "ProductionHour": prod_hour,
-                "Actual":         actual,
-                "HourlyTarget":   tgt_base,
-                "LiveTarget":     tgt_live,
-                "BucketID":       bucket_id
-              }
-            }
+            payload = _HOURLY_TMPL % (ver_js, ts, prod_date, prod_hour,
+                                      actual, tgt_base, tgt_live, bucket_id)
 
-            _publish(_topic_for(sid, "HourlyProduction"), payload, qos=qos, retain=retain)
+            out[(_topic_for(sid, "HourlyProduction"), qos, retain)].append(payload)
             sent += 1
 
             # mark only closed+unpublished hours
             if is_closed and (is_pub == 0):
-                try:
-                    _nq(_NQ_MARK_HOURLY_PUBLISHED, {
-                        "station_id": sid,
-                        "hour_start_utc": r.get("hour_start_utc")
-                    })
-                except Exception:
-                    _log_exc("publish_hourly_rows::mark_published")
-                    pass
+                marks.append({
+                    "station_id": sid,
+                    "hour_start_utc": r.get("hour_start_utc")
+                })
         except Exception:
+            # bad row: log and keep going so it can't block the rows after it
             _log_exc("publish_hourly_rows:row")
             continue
 
+    _publish_groups(out, server_name)
+    _mark_published(_NQ_MARK_HOURLY_PUBLISHED_BATCH, _NQ_MARK_HOURLY_PUBLISHED, marks,
+                    "publish_hourly_rows::mark_published")
     return sent
 
-def publish_shift_rows(rows, live_snap_unused=None, qos=0, retain=False):
-    rows = _rowdicts(rows)
+def publish_shift_rows(rows, live_snap_unused=None, qos=0, retain=False, server_name=None):
+    rows = [r for r in _rowdicts(rows) if r.get("station_id") is not None]
     if not rows:
         return 0
 
     _load_hierarchy_for([int(r["station_id"]) for r in rows])
     _load_breaks_if_needed()
 
-    ver    = _get_version()
+    ver_js = _json_str(_get_version())
+    ts     = _iso_now()      # one publish timestamp per batch
     sent   = 0
     now    = system.date.now()
     now_ms = system.date.toMillis(now)
+    out    = defaultdict(list)   # (topic, qos, retain) -> payloads, flushed after the loop
+    marks  = []
 
     for r in rows:
         try:
             sid = int(r["station_id"])
-            lid = int(r.get("line_id") or (_hier.get(sid, {}).get("line_id") or 0))
+            lid = int(r.get("line_id") or _hier.get(sid, _NO_HIER).get("line_id") or 0)
 
             # required fields from NQ
             sdate   = r.get("shift_local_date")
@@ -424,7 +558,7 @@ def publish_shift_rows(rows, live_snap_unused=None, qos=0, retain=False):
             start_ms = system.date.toMillis(s_start)
             end_ms   = system.date.toMillis(s_end)
             is_ended = 1 if (end_ms <= now_ms) else 0
-            is_pub   = _as_int_bool(r.get("is_published"))
+            is_pub   = 1 if r.get("is_published") == 1 else 0
 
             actual   = int(r.get("total_parts") or 0)
             tgt_base = int(r.get("target_parts_base") or 0)
@@ -447,44 +581,39 @@ def publish_shift_rows(rows, live_snap_unused=None, qos=0, retain=False):
                 anchor_ms = start_ms
             bucket_id = int(system.date.format(system.date.fromMillis(anchor_ms), "H"))
 
-            payload = {
-              "Version":   ver,
-              "Timestamp": _iso_now(),
-              "ShiftProduction": {
-                "ProductionDate": _fmt_date_local(sdate) + "T00:00:00",
-                "Actual":          actual,
-                "ProductionTarget":tgt_base,
-                "LiveTarget":      tgt_live,
-                "BucketID":        bucket_id
-              }
-            }
+            payload = _SHIFT_TMPL % (ver_js, ts, _fmt_date_local(sdate) + "T00:00:00",
+                                     actual, tgt_base, tgt_live, bucket_id)
 
-            _publish(_topic_for(sid, "ShiftProduction"), payload, qos=qos, retain=retain)
+            out[(_topic_for(sid, "ShiftProduction"), qos, retain)].append(payload)
             sent += 1
 
             # mark only after the final close-out publish
             if is_ended and (is_pub == 0):
-                try:
-                    _nq(_NQ_MARK_SHIFT_PUBLISHED, {
+                if r.get("shift_id") is not None:
+                    marks.append({
                         "station_id": sid,
                         "shift_id":   int(r["shift_id"]),
                         "shift_local_date": sdate
                     })
-                except Exception:
-                    _log_exc("publish_shift_rows::mark_published")
-                    pass
         except Exception:
+            # bad row: log and keep going so it can't block the rows after it
             _log_exc("publish_shift_rows:row")
             continue
 
+    _publish_groups(out, server_name)
+    _mark_published(_NQ_MARK_SHIFT_PUBLISHED_BATCH, _NQ_MARK_SHIFT_PUBLISHED, marks,
+                    "publish_shift_rows::mark_published")
     return sent
 
-def publish_weekly_rows(rows, qos=0, retain=False):
-    rows=_rowdicts(rows)
+def publish_weekly_rows(rows, qos=0, retain=False, server_name=None):
+    rows=[r for r in _rowdicts(rows) if r.get("station_id") is not None]
     if not rows: 
         return
     _load_hierarchy_for([int(r["station_id"]) for r in rows])
     ver=_get_version()
+    ts=_iso_now()           # one publish timestamp per batch
+    out=defaultdict(list)   # (topic, qos, retain) -> payloads, flushed after the loop
+    marks=[]
 
     for r in rows:
         try:
@@ -492,57 +621,73 @@ def publish_weekly_rows(rows, qos=0, retain=False):
             actual = int(r.get("total_parts") or 0)
             payload = {
               "Version":   ver,
-              "Timestamp": _iso_now(),
+              "Timestamp": ts,
               "ProductionWeekly": {
-                "Stn_ID": (_hier.get(sid) or {}).get("station_name") or ("Station_%d" % sid),
+                "Stn_ID": _hier.get(sid, _NO_HIER).get("station_name") or ("Station_%d" % sid),
                 "Value":  actual
               }
             }
-            try:
-                _publish(_topic_for(sid,"ProductionWeekly"), payload, qos=qos, retain=retain)
-            except Exception:
-                _log_exc("publish_weekly_rows:_publish")
-                pass
+            out[(_topic_for(sid,"ProductionWeekly"), qos, retain)].append(payload)
 
-            try:
-                _nq(_NQ_MARK_WEEKLY_PUBLISHED, {
+            if r.get("week_start_local") is not None:
+                marks.append({
                     "station_id": sid,
                     "week_start_local": r["week_start_local"]
                 })
-            except Exception:
-                _log_exc("publish_weekly_rows::mark_published")
-                pass
         except Exception:
+            # bad row: log and keep going so it can't block the rows after it
             _log_exc("publish_weekly_rows:row")
             continue
 
+    _publish_groups(out, server_name)
+    _mark_published(_NQ_MARK_WEEKLY_PUBLISHED_BATCH, _NQ_MARK_WEEKLY_PUBLISHED, marks,
+                    "publish_weekly_rows::mark_published")
+
 # -------- Orchestrator --------
 def publish_pending():
-    snap = _live_targets_snapshot()
+    snap   = _live_targets_snapshot()
+    server = _get_broker_name()   # one broker snapshot for all three scopes
 
     # Hourly (current + closed/unpublished)
-    try:
-        ds_h = _nq(_NQ_GET_HOURLY_TO_PUBLISH, _params_hourly())
-        if ds_h and (ds_h.getRowCount()>0):
-            publish_hourly_rows(ds_h, snap)
-    except Exception:
-        _log_exc("publish_pending::hourly")
-        pass
+    def _hourly():
+        try:
+            ds_h = _nq(_NQ_GET_HOURLY_TO_PUBLISH, _params_hourly())
+            if ds_h and (ds_h.getRowCount()>0):
+                publish_hourly_rows(ds_h, snap, server_name=server)
+        except Exception:
+            _log_exc("publish_pending::hourly")
+            pass
 
     # Shifts
-    try:
-        ds_s = _nq(_NQ_GET_SHIFT_TO_PUBLISH, _params_shift_days())
-        if ds_s and (ds_s.getRowCount()>0):
-            publish_shift_rows(ds_s, snap)
-    except Exception:
-        _log_exc("publish_pending::shifts")
-        pass
+    def _shifts():
+        try:
+            ds_s = _nq(_NQ_GET_SHIFT_TO_PUBLISH, _params_shift_days())
+            if ds_s and (ds_s.getRowCount()>0):
+                publish_shift_rows(ds_s, snap, server_name=server)
+        except Exception:
+            _log_exc("publish_pending::shifts")
+            pass
 
     # Weekly
-    try:
-        ds_w = _nq(_NQ_GET_WEEKLY_TO_PUBLISH, _params_weekly_now())
-        if ds_w and (ds_w.getRowCount()>0):
-            publish_weekly_rows(ds_w)
-    except Exception:
-        _log_exc("publish_pending::weekly")
-        pass
\ No newline at end of file
+    def _weekly():
+        try:
+            ds_w = _nq(_NQ_GET_WEEKLY_TO_PUBLISH, _params_weekly_now())
+            if ds_w and (ds_w.getRowCount()>0):
+                publish_weekly_rows(ds_w, server_name=server)
+        except Exception:
+            _log_exc("publish_pending::weekly")
+            pass
+
+    # scopes are independent (DB + MQTT bound): run them concurrently, return once all finish
+    threads = []
+    for fn in (_hourly, _shifts, _weekly):
+        try:
+            threads.append(system.util.invokeAsynchronous(fn))
+        except Exception:
+            _log_exc("publish_pending::dispatch")
+            fn()
+    for t in threads:
+        try:
+            t.join()
+        except Exception:
+            _log_exc("publish_pending::join")
\ No newline at end of file
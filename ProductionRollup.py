@@ -8,7 +8,9 @@
 # </summary>
 
 import system
-from java.util import Calendar, TimeZone
+from bisect import bisect_right
+from collections import OrderedDict
+from java.util import Calendar
 from MagnaDataOps.LoggerFunctions import log_info as _log_info, log_warn as _log_warn, log_error as _log_error
 
 # -------- Tuning --------
@@ -24,25 +26,27 @@ SHIFT_CACHE_SEC = 8
 
 # -------- Module globals (persist across timer ticks) --------
 _state = {}   # sid -> dict with hour/shift/week rolling state
-_meta  = {"stations": [], "lastStationsLoad":0, "lastShiftLoad":0, "shiftsToday":[], "shiftsYday":[],"pastShiftsByLine": {}}
+_meta  = {"stations": [], "lastStationsLoad":0, "lastShiftLoad":0, "shiftsToday":[], "shiftsYday":[],"pastShiftsByLine": {},
+          "shiftIndexByLine": {}}   # lid -> (starts_ms, [(start_ms, end_ms, shift_id, day_str, st, en)]) sorted by start
 _bootstrapped_day = None  # 'yyyy-MM-dd' of last bootstrap
+_hv_cache = OrderedDict()  # (tag, boundary_ms) -> (value at/before a past boundary, expires_ms) (LRU)
+_HV_CACHE_MAX = 8192
+_NO_STATS = (None, None, 0, False)   # window stats for a tag with no history
+_HV_SETTLE_MS = 60 * 1000  # only cache boundaries at least this far in the past (late historian stores)
+_HV_TTL_MS    = 10 * 60 * 1000  # cached values are re-queried after this, so store-and-forward
+                                # backlogs landing after an outage replace a stale boundary value
 
 
 # ====================== small time utils ======================
+# UTC has no offset, so hour boundaries are plain epoch-ms multiples of 1h (no Calendar needed)
 def _floor_hour_utc(d):
-    cal = Calendar.getInstance(TimeZone.getTimeZone("UTC"))
-    cal.setTime(d)
-    cal.set(Calendar.MILLISECOND,0); cal.set(Calendar.SECOND,0); cal.set(Calendar.MINUTE,0)
-    return cal.getTime()
+    ms = system.date.toMillis(d)
+    return system.date.fromMillis(ms - (ms % 3600000))
 
 def _ceil_hour_utc(d):
-    cal = Calendar.getInstance(TimeZone.getTimeZone("UTC"))
-    cal.setTime(d)
-    ms = cal.get(Calendar.MILLISECOND); s = cal.get(Calendar.SECOND); m = cal.get(Calendar.MINUTE)
-    if ms != 0 or s != 0 or m != 0:
-        cal.set(Calendar.MILLISECOND,0); cal.set(Calendar.SECOND,0); cal.set(Calendar.MINUTE,0)
-        cal.add(Calendar.HOUR_OF_DAY, 1)
-    return cal.getTime()
+    ms = system.date.toMillis(d)
+    r  = ms % 3600000
+    return system.date.fromMillis(ms if r == 0 else ms + (3600000 - r))
 
 def _week_start_local_sys(d, dow_1to7):
     cal = Calendar.getInstance()  # system TZ
@@ -62,9 +66,26 @@ def _hist_value_at_or_before(tag_path, at_dt):
     """
     Return the last numeric value at/before 'at_dt' (using includeBoundingValues).
     If nothing found, return None.
+    Found values for past boundaries are memoized in _hv_cache for _HV_TTL_MS; late history
+    (store-and-forward) can still land before a boundary, so entries are not kept for the day.
     """
     if not tag_path:
         return None
+    at_ms  = system.date.toMillis(at_dt)
+    now_ms = system.date.toMillis(system.date.now())
+    key = (tag_path, at_ms)
+    hit = _hv_cache.pop(key, None)   # (value, expires_ms)
+    if hit is not None and now_ms < hit[1]:
+        _hv_cache[key] = hit   # move to end (most recent)
+        return hit[0]
+    v = _hist_value_at_or_before_query(tag_path, at_dt)
+    if v is not None and at_ms <= now_ms - _HV_SETTLE_MS:
+        _hv_cache[key] = (v, now_ms + _HV_TTL_MS)
+        if len(_hv_cache) > _HV_CACHE_MAX:
+            _hv_cache.popitem(last=False)
+    return v
+
+def _hist_value_at_or_before_query(tag_path, at_dt):
     try:
         ds = system.tag.queryTagHistory(
             paths=[tag_path],
@@ -87,40 +108,140 @@ def _series_positive_delta(tag_path, start_dt, end_dt):
     """
     Reset-safe delta (sum of increases only). Dips/resets are ignored.
     """
+    return _window_stats(tag_path, start_dt, end_dt)[2]
+
+def _window_stats(tag_path, start_dt, end_dt):
+    """
+    (start_val, end_val, positive_delta, had_rows) for one tag from a single history query,
+    so a boundary value and the delta over the same window don't cost separate round-trips.
+    """
     if not tag_path or start_dt >= end_dt:
-        return 0
+        return (None, None, 0, False)
+    ds = _query_history(tag_path, start_dt, end_dt)
+    if not ds or ds.getRowCount() == 0:
+        return (None, None, 0, False)
+    return _compute_from_ds(ds, system.date.toMillis(start_dt), system.date.toMillis(end_dt))
+
+def _compute_from_ds(ds, s_ms, e_ms, col=1, ts=None):
+    """
+    One pass over a Wide history column (bounding values included):
+      start_val = last value at/before s_ms, end_val = last value at/before e_ms,
+      positive_delta = reset-safe sum of increases after s_ms,
+      had_rows = any non-null sample at/before e_ms.
+    'ts' (row epoch ms) can be passed in when several columns share one dataset.
+    """
+    if ts is None:
+        ts = [(t.getTime() if t is not None else None) for t in ds.getColumnAsList(0)]
+    start = end = peak = None
+    total = 0.0
+    had = False
+    for t, v in zip(ts, ds.getColumnAsList(col)):
+        if t is None or v is None:
+            continue
+        if t > e_ms:
+            break
+        had = True
+        try:
+            v = float(v)
+        except:
+            continue
+        if t <= s_ms:
+            start = peak = v
+        elif peak is None:
+            peak = v
+        elif v > peak:
+            total += (v - peak)
+            peak = v
+        end = v
+    return (start, end, int(total), had)
+
+def _query_history(tag_path, start_dt, end_dt):
+    """Raw history for one tag over [start_dt, end_dt] incl. bounding values (None on failure)."""
     try:
-        ds = system.tag.queryTagHistory(
+        return system.tag.queryTagHistory(
             paths=[tag_path],
             startDate=start_dt, endDate=end_dt,
             returnAggregated=False, returnFormat='Wide',
             includeBoundingValues=True
         )
     except:
-        ds = None
-    if not ds or ds.getRowCount() == 0:
-        return 0
+        return None
 
-    peak = None
-    for i in range(ds.getRowCount()):
-        try:
-            peak = float(ds.getValueAt(i, 1))
-            break
-        except:
+def _history_samples(ds):
+    """[(t_ms, float)] from a Wide single-tag history dataset; non-numeric values skipped."""
+    out = []
+    if not ds:
+        return out
+    for t, v in zip(ds.getColumnAsList(0), ds.getColumnAsList(1)):
+        if t is None or v is None:
             continue
-    if peak is None:
-        return 0
-
-    total = 0.0
-    for i in range(ds.getRowCount()):
         try:
-            v = float(ds.getValueAt(i, 1))
+            out.append((t.getTime(), float(v)))
         except:
             continue
-        if v > peak:
-            total += (v - peak)
-            peak = v
-    return int(total)
+    return out
+
+def _hourly_rollup_from_series(ds, h_start_ms, h_end_ms):
+    """
+    Sweep one history series once into hour buckets [h_start_ms, h_end_ms).
+    Returns [(start_count, end_count, positive_delta)] per hour, same math as
+    _hist_value_at_or_before / _series_positive_delta per hour: a sample at t counts
+    toward the hour (start, end]; each hour's baseline is the last value at/before its start.
+    """
+    samples = _history_samples(ds)
+    n = len(samples)
+    i = 0
+    last = None
+    out = []
+    bs = h_start_ms
+    while bs < h_end_ms:
+        be = bs + 3600000
+        while i < n and samples[i][0] <= bs:
+            last = samples[i][1]; i += 1
+        start = peak = last
+        total = 0.0
+        while i < n and samples[i][0] <= be:
+            v = samples[i][1]; i += 1
+            if peak is None:
+                peak = v
+            elif v > peak:
+                total += (v - peak)
+                peak = v
+            last = v
+        out.append((start, last, int(total)))
+        bs = be
+    return out
+
+
+def _series_positive_delta_multi(tag_paths, start_dt, end_dt):
+    """
+    One Wide queryTagHistory for many tags over [start_dt, end_dt] (bounding values on).
+    Returns {tag: (start_val, end_val, positive_delta, had_rows)} (see _compute_from_ds).
+    Tags with no data map to (None, None, 0, False).
+    """
+    out = dict((t, _NO_STATS) for t in tag_paths)
+    if not tag_paths or start_dt >= end_dt:
+        return out
+    try:
+        ds = system.tag.queryTagHistory(
+            paths=list(tag_paths),
+            startDate=start_dt, endDate=end_dt,
+            returnAggregated=False, returnFormat='Wide',
+            includeBoundingValues=True
+        )
+    except:
+        ds = None
+    if not ds or ds.getRowCount() == 0:
+        return out
+
+    s_ms = system.date.toMillis(start_dt)
+    e_ms = system.date.toMillis(end_dt)
+    ts = [(t.getTime() if t is not None else None) for t in ds.getColumnAsList(0)]
+
+    # column c holds tag_paths[c-1]; one column fetch and one pass over it per tag
+    for c, tag in enumerate(tag_paths, 1):
+        out[tag] = _compute_from_ds(ds, s_ms, e_ms, col=c, ts=ts)
+    return out
 
 
 # ====================== config & cache loads ======================
@@ -158,40 +279,52 @@ def _load_stations_if_needed(force=False):
         out.append(st)
 
     _meta["stations"], _meta["lastStationsLoad"] = out, now_sec
+    # live-read arrays for run_rollups; rebuilt only with the station list
+    _meta["tagList"]  = [s_["tag"] for s_ in out if s_["tag"]]
+    _meta["tagToSid"] = dict((s_["tag"], s_["station_id"]) for s_ in out if s_["tag"])
+    _meta["lineIds"]  = sorted(set(s_["line_id"] for s_ in out))
     return out
     
-def _reconcile_late_shifts_for_station(st, now_dt, shift_rows):
-    lid = int(st["line_id"])
-    sid = int(st["station_id"])
-    tag = st["tag"]
-    s   = _state[sid]
-
-    done = s.setdefault("past_shift_done_keys", set())
-
-    for (shid, day_str, st_dt, en_dt) in _meta.get("pastShiftsByLine", {}).get(lid, []):
-        key = u"%s|%s" % (int(shid), unicode(day_str))
-        if key in done:
-            continue  # already emitted for this station
+def _reconcile_late_shifts(stations, shift_rows):
+    """
+    Closed rows for past shift windows not yet emitted per station.
+    One multi-tag historian query per (line, window) covers all pending stations on the line.
+    """
+    by_line = {}
+    for st in stations:
+        by_line.setdefault(int(st["line_id"]), []).append(st)
 
-        # historian-anchored closed row
-        if tag:
-            start_cnt = _hist_value_at_or_before(tag, st_dt)
-            end_cnt   = _hist_value_at_or_before(tag, en_dt)
-            tot       = _series_positive_delta(tag, st_dt, en_dt)
-        else:
-            start_cnt = None; end_cnt = None; tot = 0
-
-        shift_rows.append({
-            "station_id": sid,
-            "shift_id":   int(shid),
-            "shift_local_date": day_str,
-            "total_parts": int(tot or 0),
-            "start_count": int(start_cnt) if start_cnt is not None else None,
-            "end_count":   int(end_cnt)   if end_cnt   is not None else None,
-            "is_closed":   1
-        })
-
-        done.add(key)  # mark this window reconciled
+    for lid, windows in _meta.get("pastShiftsByLine", {}).items():
+        sts = by_line.get(lid)
+        if not sts:
+            continue
+        for (shid, day_str, st_dt, en_dt) in windows:
+            key = u"%s|%s" % (int(shid), unicode(day_str))
+            try:
+                todo = [st for st in sts
+                        if key not in _state[int(st["station_id"])].setdefault("past_shift_done_keys", set())]
+                if not todo:
+                    continue  # already emitted for every station on the line
+
+                # historian-anchored closed rows
+                tags = [st["tag"] for st in todo if st["tag"]]
+                res  = _series_positive_delta_multi(tags, st_dt, en_dt) if tags else {}
+
+                for st in todo:
+                    sid = int(st["station_id"])
+                    start_cnt, end_cnt, tot, _ = res.get(st["tag"], _NO_STATS) if st["tag"] else _NO_STATS
+                    shift_rows.append({
+                        "station_id": sid,
+                        "shift_id":   int(shid),
+                        "shift_local_date": day_str,
+                        "total_parts": int(tot or 0),
+                        "start_count": int(start_cnt) if start_cnt is not None else None,
+                        "end_count":   int(end_cnt)   if end_cnt   is not None else None,
+                        "is_closed":   1
+                    })
+                    _state[sid]["past_shift_done_keys"].add(key)  # mark this window reconciled
+            except:
+                _log_warn("ProductionRollup::run_rollups", message="late shift reconcile failed for line=%s shift=%s" % (lid, key))
         
 def _load_shift_windows_if_needed(force=True):
     now = system.date.now()
@@ -205,8 +338,10 @@ def _load_shift_windows_if_needed(force=True):
     _meta["shiftsToday"] = list(system.db.runNamedQuery(_NQ_SEL + "getShiftScheduleOnDate", {"shift_date": today}) or [])
     _meta["shiftsYday"]  = list(system.db.runNamedQuery(_NQ_SEL + "getShiftScheduleOnDate", {"shift_date": yday})  or [])
 
-    # Build a per-line list of fully ended windows (end <= now) for both days
+    # Build a per-line list of fully ended windows (end <= now) for both days,
+    # plus a per-line start-sorted index of all windows for _active_shift_for_line
     past = {}
+    index = {}
     for src in (_meta["shiftsYday"], _meta["shiftsToday"]):
         for r in (src or []):
             try:
@@ -214,11 +349,17 @@ def _load_shift_windows_if_needed(force=True):
                 st  = r["start_time"];   en   = r["end_time"]
                 if not st or not en: 
                     continue
+                day_str = system.date.format(st, "yyyy-MM-dd")
+                index.setdefault(lid, []).append(
+                    (system.date.toMillis(st), system.date.toMillis(en), shid, day_str, st, en))
                 if en <= now:
-                    day_str = system.date.format(st, "yyyy-MM-dd")
                     past.setdefault(lid, []).append((shid, day_str, st, en))
             except:
                 continue
+    for lid, entries in index.items():
+        entries.sort(key=lambda e: e[0])
+        index[lid] = ([e[0] for e in entries], entries)
+    _meta["shiftIndexByLine"] = index
     # Sort each line’s list by end time to keep reconciliation deterministic
     for lid in list(past.keys()):
         past[lid].sort(key=lambda t: system.date.toMillis(t[3]))
@@ -248,17 +389,19 @@ def _ensure_init_station_state(st, settings):
             curr = 0
 
     # ----- Hour (anchor at top-of-hour)
-    hr_start_cnt = _hist_value_at_or_before(st["tag"], cur_hr_u)
+    # boundary value + partial delta from one query over [top-of-hour, now]
+    hr_start_cnt, _, hour_partial, _ = _window_stats(st["tag"], cur_hr_u, now)
+    if hr_start_cnt is None:
+        hr_start_cnt = _hist_value_at_or_before(st["tag"], cur_hr_u)
     if hr_start_cnt is None:
         hr_start_cnt = float(curr)
-    hour_partial = _series_positive_delta(st["tag"], cur_hr_u, now)
 
     # ----- Shift (if active now, anchor at shift start)
     sh_id, sh_date, sh_start, sh_end = _active_shift_for_line(int(st["line_id"]), now)
     if sh_id is not None:
-        sh_start_cnt = _hist_value_at_or_before(st["tag"], sh_start) if sh_start else float(curr)
+        sh_start_cnt, _, shift_partial, _ = _window_stats(st["tag"], sh_start, now) if sh_start else (float(curr), None, 0, False)
+        if sh_start_cnt is None: sh_start_cnt = _hist_value_at_or_before(st["tag"], sh_start)
         if sh_start_cnt is None: sh_start_cnt = float(curr)
-        shift_partial = _series_positive_delta(st["tag"], sh_start, now) if sh_start else 0
     else:
         sh_start_cnt  = float(curr)
         shift_partial = 0
@@ -281,8 +424,12 @@ def _ensure_init_station_state(st, settings):
         "shift_total": int(shift_partial),
         # week window
         "week_start_local": week_st,
+        "week_start_str": system.date.format(week_st, "yyyy-MM-dd"),
         "week_total": int(week_so_far),
         "past_shift_done_keys": set(),
+        # last open-row snapshot written (None = not yet written for this window)
+        "last_emitted_shift_total": None, "shift_last_flush": 0,
+        "last_emitted_week_total":  None, "week_last_flush":  0,
     }
 
 
@@ -297,45 +444,41 @@ def _bootstrap_today(stations, settings):
     today_str = system.date.format(now, "yyyy-MM-dd")
     start_local = system.date.parse("%s 00:00" % today_str, "yyyy-MM-dd HH:mm")
     end_local   = now
+
+    # new day: drop cached boundary values from before midnight
+    midnight_ms = system.date.toMillis(start_local)
+    for key in [k for k in _hv_cache if k[1] < midnight_ms]:
+        del _hv_cache[key]
     h_start = _floor_hour_utc(start_local)
     h_end   = _floor_hour_utc(now)  # exclusive; current hour stays live
 
-    # ---- Hourly closed slots
+    # ---- Hourly closed slots (one history query per tag, swept into hour buckets)
     h_rows = []
-    cur = h_start
-    while cur < h_end:
-        nxt = system.date.addHours(cur, 1)
-        for st in stations:
-            sid = st["station_id"]
-            lid = st["line_id"]
-            tag = st["tag"]
-            if not tag:
-                # still write dense zero to seed slot
-                h_rows.append({
-                    "station_id": sid, "line_id": lid,
-                    "hour_start_utc_ms": system.date.toMillis(cur),
-                    "total_parts": 0,
-                    "start_count": None,
-                    "end_count": None,
-                    "is_closed": 1
-                })
-                continue
-            start_cnt = _hist_value_at_or_before(tag, cur)
-            end_cnt   = _hist_value_at_or_before(tag, nxt)
-            tot = _series_positive_delta(tag, cur, nxt)
+    h_start_ms = system.date.toMillis(h_start)
+    h_end_ms   = system.date.toMillis(h_end)
+    n_hours    = max(0, (h_end_ms - h_start_ms) // 3600000)
+    for st in stations:
+        sid = st["station_id"]
+        lid = st["line_id"]
+        tag = st["tag"]
+        if tag:
+            buckets = _hourly_rollup_from_series(_query_history(tag, h_start, h_end), h_start_ms, h_end_ms)
+        else:
+            # still write dense zero to seed slot
+            buckets = [(None, None, 0)] * n_hours
+        for k, (start_cnt, end_cnt, tot) in enumerate(buckets):
             h_rows.append({
                 "station_id": sid, "line_id": lid,
-                "hour_start_utc_ms": system.date.toMillis(cur),
+                "hour_start_utc_ms": h_start_ms + k * 3600000,
                 "total_parts": int(tot or 0),
                 "start_count": int(start_cnt) if start_cnt is not None else None,
                 "end_count": int(end_cnt) if end_cnt is not None else None,
                 "is_closed": 1
             })
-        cur = nxt
 
     if h_rows:
         try:
-            system.db.runNamedQuery(_NQ_INS + "upsertHourlyBatch", {"payload": system.util.jsonEncode(h_rows)})
+            system.db.runNamedQuery(_NQ_INS + "upsertHourlyBatch", {"payload": _encode_hour_rows(h_rows)})
         except:
             _log_warn("ProductionRollup::bootstrap", message="upsertHourlyBatch failed during bootstrap")
 
@@ -357,53 +500,102 @@ def _bootstrap_today(stations, settings):
             eff_end = en_dt if en_dt <= now else now
             if eff_end <= st_dt:
                 continue
-            for st in by_line.get(lid, []):
+            sts  = by_line.get(lid, [])
+            tags = [st["tag"] for st in sts if st["tag"]]
+            res  = _series_positive_delta_multi(tags, st_dt, eff_end) if tags else {}
+            is_closed = 0 if eff_end < en_dt else 1
+            day_str   = system.date.format(st_dt, "yyyy-MM-dd")
+            for st in sts:
                 sid = st["station_id"]; tag = st["tag"]
-                start_cnt = _hist_value_at_or_before(tag, st_dt) if tag else None
-                tot = _series_positive_delta(tag, st_dt, eff_end) if tag else 0
+                start_cnt, end_cnt, tot, _ = res.get(tag, _NO_STATS) if tag else _NO_STATS
                 sh_rows.append({
                     "station_id": sid,
                     "shift_id": shift_id,
-                    "shift_local_date": system.date.format(st_dt, "yyyy-MM-dd"),
+                    "shift_local_date": day_str,
                     "total_parts": int(tot or 0),
                     "start_count": int(start_cnt) if start_cnt is not None else None,
-                    "end_count": None if eff_end < en_dt else _hist_value_at_or_before(tag, en_dt),
-                    "is_closed": 0 if eff_end < en_dt else 1
+                    "end_count": int(end_cnt) if (is_closed and end_cnt is not None) else None,
+                    "is_closed": is_closed
                 })
 
     if sh_rows:
         try:
-            system.db.runNamedQuery(_NQ_INS + "upsertShiftBatch", {"payload": system.util.jsonEncode(sh_rows)})
+            system.db.runNamedQuery(_NQ_INS + "upsertShiftBatch", {"payload": _encode_shift_rows(sh_rows)})
         except:
             _log_warn("ProductionRollup::bootstrap", message="upsertShiftBatch failed during bootstrap")
 
 
+# ====================== fixed-schema JSON payloads ======================
+# Known row shapes are formatted directly instead of walking list-of-dicts through system.util.jsonEncode.
+# Date strings are 'yyyy-MM-dd'; counts may be None -> null.
+def _jn(v):
+    return "null" if v is None else "%d" % v
+
+def _encode_hour_rows(rows):
+    return "[" + ",".join([
+        '{"station_id":%d,"line_id":%d,"hour_start_utc_ms":%d,"total_parts":%d,"start_count":%s,"end_count":%s,"is_closed":%d}'
+        % (r["station_id"], r["line_id"], r["hour_start_utc_ms"], r["total_parts"],
+           _jn(r["start_count"]), _jn(r["end_count"]), r["is_closed"])
+        for r in rows]) + "]"
+
+def _encode_hour_cols(sid_a, lid_a, hm_a, tp_a, sc_a, ec_a):
+    """_encode_hour_rows for closed rows held as parallel column lists (zipped by index)."""
+    return "[" + ",".join([
+        '{"station_id":%d,"line_id":%d,"hour_start_utc_ms":%d,"total_parts":%d,"start_count":%s,"end_count":%s,"is_closed":1}'
+        % (sid_a[i], lid_a[i], hm_a[i], tp_a[i], _jn(sc_a[i]), _jn(ec_a[i]))
+        for i in range(len(sid_a))]) + "]"
+
+def _encode_shift_rows(rows):
+    return "[" + ",".join([
+        '{"station_id":%d,"shift_id":%d,"shift_local_date":"%s","total_parts":%d,"start_count":%s,"end_count":%s,"is_closed":%d}'
+        % (r["station_id"], r["shift_id"], r["shift_local_date"], r["total_parts"],
+           _jn(r["start_count"]), _jn(r["end_count"]), r["is_closed"])
+        for r in rows]) + "]"
+
+def _encode_week_rows(rows):
+    return "[" + ",".join([
+        '{"station_id":%d,"week_start_local":"%s","total_parts":%d,"is_closed":%d}'
+        % (r["station_id"], r["week_start_local"], r["total_parts"], r["is_closed"])
+        for r in rows]) + "]"
+
+def _encode_wm_rows(rows):
+    return "[" + ",".join([
+        '{"station_id":%d,"last_utc_ms":%d,"cur_hour_start_utc_ms":%d,"cur_hour_start_count":%d,"cur_hour_last_peak":%d}'
+        % (r["station_id"], r["last_utc_ms"], r["cur_hour_start_utc_ms"],
+           r["cur_hour_start_count"], r["cur_hour_last_peak"])
+        for r in rows]) + "]"
+
+
 # ====================== batched DB writes ======================
+def _flush_chunked(nq_name, rows, encode, chunk=500):
+    """Upsert rows through a batch NQ, at most 'chunk' rows per payload (as backfill_day_dense does)."""
+    for i in range(0, len(rows), chunk):
+        system.db.runNamedQuery(_NQ_INS + nq_name, {"payload": encode(rows[i:i + chunk])})
+
 def _flush_batches(hour_rows, shift_rows, week_rows, wm_rows):
     try:
         if hour_rows:
-            system.db.runNamedQuery(_NQ_INS + "upsertHourlyBatch", {"payload": system.util.jsonEncode(hour_rows)})
+            _flush_chunked("upsertHourlyBatch", hour_rows, _encode_hour_rows)
         if shift_rows:
-            system.db.runNamedQuery(_NQ_INS + "upsertShiftBatch",  {"payload": system.util.jsonEncode(shift_rows)})
+            _flush_chunked("upsertShiftBatch", shift_rows, _encode_shift_rows)
         if week_rows:
-            system.db.runNamedQuery(_NQ_INS + "upsertWeeklyBatch", {"payload": system.util.jsonEncode(week_rows)})
+            _flush_chunked("upsertWeeklyBatch", week_rows, _encode_week_rows)
         if wm_rows:
-            system.db.runNamedQuery(_NQ_INS + "upsertHourlyWatermarksBatch", {"payload": system.util.jsonEncode(wm_rows)})
+            _flush_chunked("upsertHourlyWatermarksBatch", wm_rows, _encode_wm_rows)
     except:
         _log_error("ProductionRollup::flush_batches")
 
 def _active_shift_for_line(line_id, at_dt):
-    # today then yesterday (overnight)
-    for r in _meta["shiftsToday"]:
-        if int(r["line_id"]) == line_id:
-            st, en = r["start_time"], r["end_time"]
-            if st and en and (st <= at_dt < en):   # end exclusive
-                return (int(r["shift_id"]), system.date.format(st,"yyyy-MM-dd"), st, en)
-    for r in _meta["shiftsYday"]:
-        if int(r["line_id"]) == line_id:
-            st, en = r["start_time"], r["end_time"]
-            if st and en and (st <= at_dt < en):   # end exclusive
-                return (int(r["shift_id"]), system.date.format(st,"yyyy-MM-dd"), st, en)
+    # today + yesterday (overnight) windows, sorted by start; a line's windows don't overlap,
+    # so the only candidate is the last one starting at/before at_dt
+    idx = _meta["shiftIndexByLine"].get(line_id)
+    if idx:
+        starts, entries = idx
+        i = bisect_right(starts, system.date.toMillis(at_dt)) - 1
+        if i >= 0:
+            s_ms, e_ms, shid, day_str, st, en = entries[i]
+            if system.date.toMillis(at_dt) < e_ms:   # end exclusive
+                return (shid, day_str, st, en)
     return (None, None, None, None)
 
 # ====================== public entry (call every 5s) ======================
@@ -438,27 +630,21 @@ def run_rollups():
             _ensure_init_station_state(st, settings)
 
         # batch-read live counters (good quality only)
-        tags, idx = [], {}
-        for st in stations:
-            if st["tag"]:
-                idx[st["tag"]] = st["station_id"]
-                tags.append(st["tag"])
+        tags = _meta.get("tagList") or []
+        idx  = _meta.get("tagToSid") or {}
         reads = system.tag.readBlocking(tags) if tags else []
 
         now     = system.date.now()
         now_ms  = system.date.toMillis(now)
         cur_hr  = _floor_hour_utc(now)
         week_st = _week_start_local_sys(now, settings["week_start_dow"])
+        week_str = system.date.format(week_st, "yyyy-MM-dd")   # formatted once per tick
 
         # prepare batches
         hour_rows, shift_rows, week_rows, wm_rows = [], [], [], []
 
         # RECONCILE: write closed rows for any past windows we learned about late
-        for st in stations:
-            try:
-                _reconcile_late_shifts_for_station(st, now, shift_rows)
-            except:
-                _log_warn(loc, message="late shift reconcile failed for sid=%s" % st["station_id"])
+        _reconcile_late_shifts(stations, shift_rows)
 
         # map current values
         cur_by_sid = {}
@@ -471,131 +657,161 @@ def run_rollups():
             except:
                 pass
 
-        for st in stations:
-            sid = st["station_id"]
-            s   = _state[sid]
-            curr = cur_by_sid.get(sid, s["last_peak"])  # freeze on bad quality
+        # IDLE GATE: no counter moved and no hour/week/shift boundary since the last full pass,
+        # so the loop below would only emit keepalives; skip it until one of those is due
+        shift_sig = tuple(_active_shift_for_line(lid, now)[:2] for lid in (_meta.get("lineIds") or []))
+        tick_sig  = (cur_by_sid, cur_hr.getTime(), week_str, shift_sig, id(stations))
+        idle_tick = (tick_sig == _meta.get("prevTickSig")) and now_ms < _meta.get("nextIdleDueMs", 0)
+
+        if not idle_tick:
+            next_due = now_ms
+            for st in stations:
+                sid = st["station_id"]
+                s   = _state[sid]
+                curr = cur_by_sid.get(sid, s["last_peak"])  # freeze on bad quality
             
-            # -------- Hour rollover detection --------
-            if s["hour_start_utc"].getTime() != cur_hr.getTime():
-                # close previous hour window
-                hour_rows.append({
-                    "station_id": sid,
-                    "line_id":    s["line_id"],
-                    "hour_start_utc_ms": system.date.toMillis(s["hour_start_utc"]),
-                    "total_parts": int(max(0, s["hour_total"])),
-                    "start_count": int(s["hour_start_count"]),
-                    "end_count":   int(s["last_peak"]),
-                    "is_closed":   1
-                })
-                wm_rows.append({
-                    "station_id": sid,
-                    "last_utc_ms": system.date.toMillis(s["hour_start_utc"]),
-                    "cur_hour_start_utc_ms": system.date.toMillis(cur_hr),
-                    "cur_hour_start_count": int(curr),
-                    "cur_hour_last_peak":   int(curr)
-                })
-                # reset hour baselines
-                s["hour_start_utc"]   = cur_hr
-                # anchor to boundary (historian) if available
-                hr_start_cnt = _hist_value_at_or_before(s["tag"], cur_hr)
-                s["hour_start_count"] = int(hr_start_cnt) if hr_start_cnt is not None else curr
-                s["hour_total"]       = 0
-                s["last_peak"]        = curr
-                s["hour_last_flush"]  = now_ms
+                # -------- Hour rollover detection --------
+                if s["hour_start_utc"].getTime() != cur_hr.getTime():
+                    # close previous hour window
+                    hour_rows.append({
+                        "station_id": sid,
+                        "line_id":    s["line_id"],
+                        "hour_start_utc_ms": system.date.toMillis(s["hour_start_utc"]),
+                        "total_parts": int(max(0, s["hour_total"])),
+                        "start_count": int(s["hour_start_count"]),
+                        "end_count":   int(s["last_peak"]),
+                        "is_closed":   1
+                    })
+                    wm_rows.append({
+                        "station_id": sid,
+                        "last_utc_ms": system.date.toMillis(s["hour_start_utc"]),
+                        "cur_hour_start_utc_ms": system.date.toMillis(cur_hr),
+                        "cur_hour_start_count": int(curr),
+                        "cur_hour_last_peak":   int(curr)
+                    })
+                    # reset hour baselines
+                    s["hour_start_utc"]   = cur_hr
+                    # anchor to boundary (historian) if available
+                    hr_start_cnt = _hist_value_at_or_before(s["tag"], cur_hr)
+                    s["hour_start_count"] = int(hr_start_cnt) if hr_start_cnt is not None else curr
+                    s["hour_total"]       = 0
+                    s["last_peak"]        = curr
+                    s["hour_last_flush"]  = now_ms
             
-            # -------- Incremental accumulation (reset-safe) --------
-            if curr >= s["last_peak"]:
-                inc = curr - s["last_peak"]
-                if inc > 0:
+                # -------- Incremental accumulation (reset-safe) --------
+                if curr >= s["last_peak"]:
+                    inc = curr - s["last_peak"]
+                    if inc > 0:
+                        s["last_peak"] = curr
+                        s["hour_total"] += inc
+                        s["shift_total"] += inc
+                        s["week_total"]  += inc
+                else:
+                    # counter reset/dip → accept new baseline
                     s["last_peak"] = curr
-                    s["hour_total"] += inc
-                    s["shift_total"] += inc
-                    s["week_total"]  += inc
-            else:
-                # counter reset/dip → accept new baseline
-                s["last_peak"] = curr
             
-            # occasional open-hour write to keep charts alive
-            if (now_ms - s["hour_last_flush"]) >= (WRITE_IDLE_SEC * 1000):
-                hour_rows.append({
-                    "station_id": sid,
-                    "line_id":    s["line_id"],
-                    "hour_start_utc_ms": system.date.toMillis(s["hour_start_utc"]),
-                    "total_parts": int(max(0, s["hour_total"])),
-                    "start_count": int(s["hour_start_count"]),
-                    "end_count":   None,
-                    "is_closed":   0
-                })
-                s["hour_last_flush"] = now_ms
+                # occasional open-hour write to keep charts alive
+                if (now_ms - s["hour_last_flush"]) >= (WRITE_IDLE_SEC * 1000):
+                    hour_rows.append({
+                        "station_id": sid,
+                        "line_id":    s["line_id"],
+                        "hour_start_utc_ms": system.date.toMillis(s["hour_start_utc"]),
+                        "total_parts": int(max(0, s["hour_total"])),
+                        "start_count": int(s["hour_start_count"]),
+                        "end_count":   None,
+                        "is_closed":   0
+                    })
+                    s["hour_last_flush"] = now_ms
             
-            # -------- Shift handling (use 4-value tuple) --------
-            cur_sh_id, cur_sh_date, cur_sh_start, cur_sh_end = _active_shift_for_line(int(s["line_id"]), now)
-            try:
-                # If the tuple we just got has an end <= now, treat it as no current shift
-                if (cur_sh_id is not None) and cur_sh_end and \
-                   (system.date.toMillis(now) >= system.date.toMillis(cur_sh_end)):
-                    cur_sh_id, cur_sh_date, cur_sh_start, cur_sh_end = (None, None, None, None)
-            except:
-                pass
+                # -------- Shift handling (use 4-value tuple) --------
+                cur_sh_id, cur_sh_date, cur_sh_start, cur_sh_end = _active_shift_for_line(int(s["line_id"]), now)
+                try:
+                    # If the tuple we just got has an end <= now, treat it as no current shift
+                    if (cur_sh_id is not None) and cur_sh_end and \
+                       (system.date.toMillis(now) >= system.date.toMillis(cur_sh_end)):
+                        cur_sh_id, cur_sh_date, cur_sh_start, cur_sh_end = (None, None, None, None)
+                except:
+                    pass
+            
+                if s["shift_id"] != cur_sh_id or s["shift_date"] != cur_sh_date:
+                    # close previous shift if any
+                    if s["shift_id"] is not None and s["shift_date"]:
+                        shift_rows.append({
+                            "station_id": sid,
+                            "shift_id": s["shift_id"],
+                            "shift_local_date": s["shift_date"],
+                            "total_parts": int(max(0, s["shift_total"])),
+                            "start_count": int(s["shift_start_count"]),
+                            "end_count": int(s["last_peak"]),
+                            "is_closed": 1
+                        })
+                    # open new shift (anchor at true shift start)
+                    s["shift_id"] = cur_sh_id
+                    s["shift_date"] = cur_sh_date
+                    s["last_emitted_shift_total"] = None   # new window: first open row always written
+                    if cur_sh_id is not None:
+                        base, _, sh_partial, _ = _window_stats(s["tag"], cur_sh_start, now) if cur_sh_start else _NO_STATS
+                        if base is None and cur_sh_start:
+                            base = _hist_value_at_or_before(s["tag"], cur_sh_start)
+                        s["shift_start_count"] = int(base) if base is not None else curr
+                        s["shift_total"] = sh_partial
+                    else:
+                        s["shift_start_count"] = curr
+                        s["shift_total"] = 0
             
-            if s["shift_id"] != cur_sh_id or s["shift_date"] != cur_sh_date:
-                # close previous shift if any
-                if s["shift_id"] is not None and s["shift_date"]:
+                # upsert current (open) shift snapshot when it changed, or every WRITE_IDLE_SEC so deletions self-heal
+                sh_tot = int(max(0, s["shift_total"]))
+                if s["shift_id"] is not None and (
+                        sh_tot != s.get("last_emitted_shift_total") or
+                        (now_ms - s.get("shift_last_flush", 0)) >= (WRITE_IDLE_SEC * 1000)):
+                    s["last_emitted_shift_total"] = sh_tot
+                    s["shift_last_flush"] = now_ms
                     shift_rows.append({
                         "station_id": sid,
                         "shift_id": s["shift_id"],
                         "shift_local_date": s["shift_date"],
-                        "total_parts": int(max(0, s["shift_total"])),
+                        "total_parts": sh_tot,
                         "start_count": int(s["shift_start_count"]),
-                        "end_count": int(s["last_peak"]),
-                        "is_closed": 1
+                        "end_count": None,
+                        "is_closed": 0
                     })
-                # open new shift (anchor at true shift start)
-                s["shift_id"] = cur_sh_id
-                s["shift_date"] = cur_sh_date
-                if cur_sh_id is not None:
-                    base = _hist_value_at_or_before(s["tag"], cur_sh_start) if cur_sh_start else None
-                    s["shift_start_count"] = int(base) if base is not None else curr
-                    s["shift_total"] = _series_positive_delta(s["tag"], cur_sh_start, now) if cur_sh_start else 0
-                else:
-                    s["shift_start_count"] = curr
-                    s["shift_total"] = 0
-            
-            # upsert current (open) shift snapshot each tick so deletions self-heal
-            if s["shift_id"] is not None:
-                shift_rows.append({
-                    "station_id": sid,
-                    "shift_id": s["shift_id"],
-                    "shift_local_date": s["shift_date"],
-                    "total_parts": int(max(0, s["shift_total"])),
-                    "start_count": int(s["shift_start_count"]),
-                    "end_count": None,
-                    "is_closed": 0
-                })
             
-            # -------- Weekly handling (local week anchor) --------
-            if system.date.format(s["week_start_local"], "yyyy-MM-dd") != system.date.format(week_st, "yyyy-MM-dd"):
-                # close last week
-                week_rows.append({
-                    "station_id": sid,
-                    "week_start_local": system.date.format(s["week_start_local"], "yyyy-MM-dd"),
-                    "total_parts": int(max(0, s["week_total"])),
-                    "is_closed": 1
-                })
-                # open new week
-                s["week_start_local"] = week_st
-                # seed week baseline from historian at week start
-                week_seed = _series_positive_delta(s["tag"], week_st, now)
-                s["week_total"] = int(week_seed)
+                # -------- Weekly handling (local week anchor) --------
+                if s["week_start_str"] != week_str:
+                    # close last week
+                    week_rows.append({
+                        "station_id": sid,
+                        "week_start_local": s["week_start_str"],
+                        "total_parts": int(max(0, s["week_total"])),
+                        "is_closed": 1
+                    })
+                    # open new week
+                    s["week_start_local"] = week_st
+                    s["week_start_str"]   = week_str
+                    # seed week baseline from historian at week start
+                    week_seed = _series_positive_delta(s["tag"], week_st, now)
+                    s["week_total"] = int(week_seed)
+                    s["last_emitted_week_total"] = None
             
-            # upsert current (open) week
-            week_rows.append({
-                "station_id": sid,
-                "week_start_local": system.date.format(s["week_start_local"], "yyyy-MM-dd"),
-                "total_parts": int(max(0, s["week_total"])),
-                "is_closed": 0
-            })
+                # upsert current (open) week when it changed, or every WRITE_IDLE_SEC
+                wk_tot = int(max(0, s["week_total"]))
+                if (wk_tot != s.get("last_emitted_week_total") or
+                        (now_ms - s.get("week_last_flush", 0)) >= (WRITE_IDLE_SEC * 1000)):
+                    s["last_emitted_week_total"] = wk_tot
+                    s["week_last_flush"] = now_ms
+                    week_rows.append({
+                        "station_id": sid,
+                        "week_start_local": s["week_start_str"],
+                        "total_parts": wk_tot,
+                        "is_closed": 0
+                    })
+
+                # earliest keepalive due across stations (open hour / week / shift)
+                next_due = min(next_due, s["hour_last_flush"], s["week_last_flush"],
+                               s["shift_last_flush"] if s["shift_id"] is not None else next_due)
+
+            _meta["prevTickSig"]   = tick_sig
+            _meta["nextIdleDueMs"] = next_due + WRITE_IDLE_SEC * 1000
 
         # -------- Persist all changes in 3–4 batched NQs --------
         if hour_rows or shift_rows or week_rows or wm_rows:
@@ -630,31 +846,27 @@ def backfill_day_dense(date_str, write_zero_on_no_data=True, chunk=500):
         cur_u = _floor_hour_utc(start_local)
         end_u = _floor_hour_utc(end_local)
 
-        hourly_rows, h_up = [], 0
+        # closed hour rows as parallel columns (no dict per station-hour)
+        cols = ([], [], [], [], [], [])
+        sid_a, lid_a, hm_a, tp_a, sc_a, ec_a = cols   # station_id, line_id, hour_start_utc_ms, total_parts, start/end_count
+        h_up = 0
+        all_tags = [st["tag"] for st in stations if st["tag"]]
         while cur_u < end_u:
             nxt_u = system.date.addHours(cur_u, 1)
+            hm    = system.date.toMillis(cur_u)
+            # one multi-tag historian query per hour for every station
+            res = _series_positive_delta_multi(all_tags, cur_u, nxt_u) if all_tags else {}
             for st in stations:
                 sid, lid, tag = st["station_id"], st["line_id"], st["tag"]
 
                 if tag:
-                    # Anchor boundaries to last value at/before the boundary time
-                    start_cnt = _hist_value_at_or_before(tag, cur_u)
-                    end_cnt   = _hist_value_at_or_before(tag, nxt_u)
+                    # Boundaries anchored to last value at/before the boundary time
+                    start_cnt, end_cnt, tot, had_rows = res.get(tag, _NO_STATS)
 
-                    # Detect if we have *any* data context for this hour (inside or bounding)
-                    had = False
-                    try:
-                        ds = system.tag.queryTagHistory(
-                            paths=[tag], startDate=cur_u, endDate=nxt_u,
-                            returnAggregated=False, returnFormat='Wide', includeBoundingValues=True
-                        )
-                        had = bool(ds and ds.getRowCount() > 0) or (start_cnt is not None) or (end_cnt is not None)
-                    except:
-                        had = (start_cnt is not None) or (end_cnt is not None)
+                    # Any data context for this hour (inside or bounding)?
+                    had = had_rows or (start_cnt is not None) or (end_cnt is not None)
 
-                    if had:
-                        tot = _series_positive_delta(tag, cur_u, nxt_u)
-                    else:
+                    if not had:
                         if not write_zero_on_no_data:
                             continue
                         tot = 0
@@ -665,32 +877,30 @@ def backfill_day_dense(date_str, write_zero_on_no_data=True, chunk=500):
                         continue
                     tot, start_cnt, end_cnt = 0, None, None
 
-                hourly_rows.append({
-                    "station_id": sid,
-                    "line_id":    lid,
-                    "hour_start_utc_ms": system.date.toMillis(cur_u),
-                    "total_parts": int(tot or 0),
-                    "start_count": int(start_cnt) if start_cnt is not None else None,
-                    "end_count":   int(end_cnt)   if end_cnt   is not None else None,
-                    "is_closed":   1
-                })
+                sid_a.append(sid)
+                lid_a.append(lid)
+                hm_a.append(hm)
+                tp_a.append(int(tot or 0))
+                sc_a.append(int(start_cnt) if start_cnt is not None else None)
+                ec_a.append(int(end_cnt)   if end_cnt   is not None else None)
 
-            if len(hourly_rows) >= int(chunk):
+            if len(sid_a) >= int(chunk):
                 try:
                     system.db.runNamedQuery(_NQ_INS + "upsertHourlyBatch",
-                                            {"payload": system.util.jsonEncode(hourly_rows)})
-                    h_up += len(hourly_rows)
+                                            {"payload": _encode_hour_cols(*cols)})
+                    h_up += len(sid_a)
                 except:
                     _log_error(loc + "::upsertHourlyBatch")
-                hourly_rows = []
+                for a in cols:
+                    del a[:]
             cur_u = nxt_u
 
         # Flush remainder
-        if hourly_rows:
+        if sid_a:
             try:
                 system.db.runNamedQuery(_NQ_INS + "upsertHourlyBatch",
-                                        {"payload": system.util.jsonEncode(hourly_rows)})
-                h_up += len(hourly_rows)
+                                        {"payload": _encode_hour_cols(*cols)})
+                h_up += len(sid_a)
             except:
                 _log_error(loc + "::upsertHourlyBatch(remainder)")
 
@@ -710,13 +920,14 @@ def backfill_day_dense(date_str, write_zero_on_no_data=True, chunk=500):
                 if not st_dt or not en_dt or en_dt <= st_dt:
                     continue
 
-                for st in by_line.get(lid, []):
+                sts  = by_line.get(lid, [])
+                tags = [st["tag"] for st in sts if st["tag"]]
+                res  = _series_positive_delta_multi(tags, st_dt, en_dt) if tags else {}
+                for st in sts:
                     sid, tag = st["station_id"], st["tag"]
                     if tag:
-                        start_cnt = _hist_value_at_or_before(tag, st_dt)
-                        end_cnt   = _hist_value_at_or_before(tag, en_dt)
-                        tot       = _series_positive_delta(tag, st_dt, en_dt)
-                        had       = (tot > 0) or (start_cnt is not None) or (end_cnt is not None)
+                        start_cnt, end_cnt, tot, had_rows = res.get(tag, _NO_STATS)
+                        had       = had_rows or (tot > 0) or (start_cnt is not None) or (end_cnt is not None)
                         if not had and not write_zero_on_no_data:
                             continue
                     else:
@@ -737,7 +948,7 @@ def backfill_day_dense(date_str, write_zero_on_no_data=True, chunk=500):
                 if len(sh_rows) >= int(chunk):
                     try:
                         system.db.runNamedQuery(_NQ_INS + "upsertShiftBatch",
-                                                {"payload": system.util.jsonEncode(sh_rows)})
+                                                {"payload": _encode_shift_rows(sh_rows)})
                         sh_up += len(sh_rows)
                     except:
                         _log_error(loc + "::upsertShiftBatch")
@@ -747,7 +958,7 @@ def backfill_day_dense(date_str, write_zero_on_no_data=True, chunk=500):
         if sh_rows:
             try:
                 system.db.runNamedQuery(_NQ_INS + "upsertShiftBatch",
-                                        {"payload": system.util.jsonEncode(sh_rows)})
+                                        {"payload": _encode_shift_rows(sh_rows)})
                 sh_up += len(sh_rows)
             except:
                 _log_error(loc + "::upsertShiftBatch(remainder)")
@@ -130,12 +130,13 @@ RESPONSE_CODE_MAP = {
     
 
 }
+
+# Fallback for unmapped codes (shared, read-only)
+UNKNOWN_RESPONSE = {"message": "Unknown response code.", "type_id": TYPE_ID_LIST["Info"]}
+
 # -----------------------------------------------------
 # Function to get message + type_id for a given code
 # -----------------------------------------------------
 def get_response_code_mapping(code):
 
-    return RESPONSE_CODE_MAP.get(
-        code,
-        {"message": "Unknown response code.", "type_id": TYPE_ID_LIST["Info"]}
-    )
\ No newline at end of file
+    return RESPONSE_CODE_MAP.get(code, UNKNOWN_RESPONSE)
\ No newline at end of file